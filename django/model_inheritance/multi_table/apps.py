@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MultiTableConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'multi_table'
+
+    def ready(self):
+        from . import signals
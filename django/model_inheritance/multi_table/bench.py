@@ -0,0 +1,125 @@
+# run from the model_inheritance directory: python manage.py bench summary
+# every benchmark works inside a transaction that is rolled back
+import random
+import time
+
+from django.db import connection, transaction
+
+from .models import Location, Restaurant, RestaurantSummary
+
+
+class Rollback(Exception):
+    pass
+
+
+def fill_restaurants(count, batch_size=10000):
+    # the three tables written directly, with plain executemany
+    rng = random.Random(0)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MAX(id) FROM {Location._meta.db_table}")
+        first = (cursor.fetchone()[0] or 0) + 1
+        for start in range(first, first + count, batch_size):
+            ids = range(start, min(start + batch_size, first + count))
+            rows = [
+                (pk, f"r{pk}", f"street {pk % 1000}", rng.randint(1, 5)) for pk in ids
+            ]
+            cursor.executemany(
+                f"INSERT INTO {Location._meta.db_table} (id, name, address) "
+                f"VALUES (%s, %s, %s)",
+                [row[:3] for row in rows],
+            )
+            cursor.executemany(
+                f"INSERT INTO {Restaurant._meta.db_table} (location_ptr_id, star) "
+                f"VALUES (%s, %s)",
+                [(row[0], row[3]) for row in rows],
+            )
+            cursor.executemany(
+                f"INSERT INTO {RestaurantSummary._meta.db_table} "
+                f"(restaurant_id, name, address, star) VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+        for model in [Location, Restaurant, RestaurantSummary]:
+            cursor.execute(f"ANALYZE {model._meta.db_table}")
+    return first
+
+
+def time_query(run, repeat):
+    start = time.perf_counter()
+    for index in range(repeat):
+        run(index)
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_summary(options):
+    count = options["restaurants"]
+    managers = {"join": Restaurant.objects, "summary": Restaurant.summaries}
+    queries = {
+        "get": lambda restaurants, index: restaurants.get(
+            pk=first + index * 7919 % count
+        ),
+        "page": lambda restaurants, index: list(
+            restaurants.order_by("pk")[index * 1000 % count :][:100]
+        ),
+        # query.py looks restaurants up by name
+        "name": lambda restaurants, index: list(
+            restaurants.filter(name=f"r{first + index * 7919 % count}")
+        ),
+        "star": lambda restaurants, index: list(
+            restaurants.filter(star=5).order_by("name")[:100]
+        ),
+        "count": lambda restaurants, index: restaurants.filter(star=5).count(),
+        "list": lambda restaurants, index: sum(1 for _ in restaurants.iterator()),
+    }
+
+    try:
+        with transaction.atomic():
+            start = time.perf_counter()
+            first = fill_restaurants(count)
+            print(f"{count} restaurants in {time.perf_counter() - start:.1f} s")
+
+            for query, run in queries.items():
+                for name, restaurants in managers.items():
+                    repeat = 1 if query == "list" else options["repeat"]
+                    spent = time_query(lambda index: run(restaurants, index), repeat)
+                    print(f"{query:>6} {name:>7}: {spent * 1e3:9.3f} ms")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def create_each(restaurants):
+    for restaurant in restaurants:
+        Restaurant.objects.create(
+            name=restaurant.name, address=restaurant.address, star=restaurant.star
+        )
+
+
+def bench_load(options):
+    # --restaurants created one by one and with bulk_load, each in its own
+    # transaction
+    count = options["restaurants"]
+    loaders = {
+        "create": create_each,
+        "bulk_load": Restaurant.objects.bulk_load,
+    }
+
+    for name, load in loaders.items():
+        restaurants = [
+            Restaurant(name=f"r{index}", address=f"street {index % 1000}", star=5)
+            for index in range(count)
+        ]
+        try:
+            with transaction.atomic():
+                start = time.perf_counter()
+                load(restaurants)
+                spent = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        print(f"{name:>9}: {spent:6.2f} s, {count / spent:8.0f} restaurants/s")
+
+
+BENCHMARKS = {
+    "summary": bench_summary,
+    "load": bench_load,
+}
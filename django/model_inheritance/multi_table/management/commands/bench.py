@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from multi_table.bench import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Runs a benchmark of the restaurants, the database is left as it was"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=BENCHMARKS)
+        parser.add_argument("--restaurants", type=int, default=1000000)
+        parser.add_argument("--repeat", type=int, default=100)
+
+    def handle(self, *args, **options):
+        BENCHMARKS[options["name"]](options)
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_summaries(apps, schema_editor):
+    # one INSERT ... SELECT of the restaurants there already are
+    Restaurant = apps.get_model("multi_table", "Restaurant")
+    RestaurantSummary = apps.get_model("multi_table", "RestaurantSummary")
+    select, params = (
+        Restaurant.objects.using(schema_editor.connection.alias)
+        .values_list("pk", "name", "address", "star")
+        .query.sql_with_params()
+    )
+    schema_editor.execute(
+        f"INSERT INTO {RestaurantSummary._meta.db_table} "
+        f"(restaurant_id, name, address, star) {select}",
+        params,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("multi_table", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RestaurantSummary",
+            fields=[
+                (
+                    "restaurant",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to="multi_table.restaurant",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50)),
+                ("address", models.CharField(max_length=80)),
+                ("star", models.IntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["name"], name="summary_name_idx"),
+                    models.Index(fields=["star", "name"], name="summary_star_name_idx"),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,194 @@
-from django.db import models
+import operator
+
+from django.db import NotSupportedError, connections, models, transaction
+
+
+def get_child_links(model):
+    # the reverse parent links of the models inheriting from the model
+    return [rel for rel in model._meta.related_objects if rel.parent_link]
+
+
+def get_child_paths(model, prefix=""):
+    paths = []
+    for rel in get_child_links(model):
+        path = prefix + rel.field.related_query_name()
+        paths += [path] + get_child_paths(rel.related_model, path + "__")
+    return paths
+
+
+def downcast(obj):
+    for rel in get_child_links(type(obj)):
+        child = rel.get_cached_value(obj, None)
+        if child is not None:
+            return downcast(child)
+    return obj
+
+
+class PolymorphicIterable(models.query.ModelIterable):
+    def __iter__(self):
+        for obj in super().__iter__():
+            yield downcast(obj)
+
+
+class LocationQuerySet(models.QuerySet):
+    def polymorphic(self):
+        # the tables of the children are LEFT JOINed into the same query,
+        # every row comes as the most derived model it has a row for
+        queryset = self.select_related(*get_child_paths(self.model))
+        queryset._iterable_class = PolymorphicIterable
+        return queryset
 
 
 class Location(models.Model):
     name = models.CharField(max_length=50)
     address = models.CharField(max_length=80)
 
+    objects = LocationQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - {self.address}"
 
 
+class RestaurantIterable(models.query.BaseIterable):
+    # builds a Restaurant of every summary row, as if it was read through
+    # the join, with no summary instance in between
+    def __iter__(self):
+        queryset = self.queryset
+        db = queryset.db
+        compiler = queryset.query.get_compiler(using=db)
+        results = compiler.execute_sql(
+            chunked_fetch=self.chunked_fetch, chunk_size=self.chunk_size
+        )
+        columns = {
+            compiler.select[index][0].target.attname: index
+            for index in compiler.klass_info["select_fields"]
+        }
+        # the pk of the summary is the pk of the location and the parent link
+        columns["id"] = columns["location_ptr_id"] = columns.pop("restaurant_id")
+        fields = [
+            field.attname
+            for field in Restaurant._meta.concrete_fields
+            if field.attname in columns
+        ]
+        get_values = operator.itemgetter(*[columns[field] for field in fields])
+        for row in compiler.results_iter(results):
+            yield Restaurant.from_db(db, fields, get_values(row))
+
+
+class RestaurantSummaryQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = RestaurantIterable
+
+    def update(self, **kwargs):
+        raise TypeError("Restaurant summaries are read only, update Restaurant")
+
+    def delete(self):
+        raise TypeError("Restaurant summaries are read only, delete Restaurant")
+
+
+class RestaurantSummaryManager(models.Manager):
+    # read only queries of restaurants from the summary table, without the
+    # join of location and restaurant; the filters are those of the
+    # summary, pk and the fields of Restaurant
+    def get_queryset(self):
+        return RestaurantSummaryQuerySet(RestaurantSummary, using=self._db)
+
+
+def insert_rows(connection, model, fields, rows):
+    # plain executemany, building model instances for the insert compiler
+    # of bulk_create costs more than writing the rows
+    fields = [model._meta.get_field(name) for name in fields]
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(quote_name(field.column) for field in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {quote_name(model._meta.db_table)} ({columns}) "
+            f"VALUES ({placeholders})",
+            [
+                [
+                    field.get_db_prep_save(value, connection)
+                    for field, value in zip(fields, row)
+                ]
+                for row in rows
+            ],
+        )
+
+
+class RestaurantManager(models.Manager):
+    def bulk_load(self, restaurants, batch_size=1000):
+        # bulk_create refuses models with parents: the locations of a batch
+        # go in with bulk_create, which gives them their pks, then the rows
+        # of restaurant and of the summaries with the same pks, all in one
+        # transaction; the restaurants are returned saved
+        restaurants = list(restaurants)
+        connection = connections[self.db]
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise NotSupportedError("bulk_load needs the pks of bulk_create")
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            for start in range(0, len(restaurants), batch_size):
+                batch = restaurants[start : start + batch_size]
+                locations = Location.objects.using(self.db).bulk_create(
+                    [
+                        Location(name=restaurant.name, address=restaurant.address)
+                        for restaurant in batch
+                    ]
+                )
+                for restaurant, location in zip(batch, locations):
+                    restaurant.id = restaurant.location_ptr_id = location.pk
+                    restaurant._state.adding = False
+                    restaurant._state.db = self.db
+
+                insert_rows(
+                    connection,
+                    self.model,
+                    ["location_ptr", "star"],
+                    [(restaurant.pk, restaurant.star) for restaurant in batch],
+                )
+                # bulk writes send no signals
+                insert_rows(
+                    connection,
+                    RestaurantSummary,
+                    ["restaurant", "name", "address", "star"],
+                    [
+                        (
+                            restaurant.pk,
+                            restaurant.name,
+                            restaurant.address,
+                            restaurant.star,
+                        )
+                        for restaurant in batch
+                    ],
+                )
+        return restaurants
+
+
 class Restaurant(Location):
     star = models.IntegerField()
 
+    objects = RestaurantManager()
+    summaries = RestaurantSummaryManager()
+
     def __str__(self):
         return f"{self.name} - {self.address} - {self.star}"
+
+
+class RestaurantSummary(models.Model):
+    # name, address and star of every restaurant in one table, kept by the
+    # signals; a write of a restaurant writes its summary too
+    restaurant = models.OneToOneField(
+        Restaurant, on_delete=models.CASCADE, primary_key=True, related_name="summary"
+    )
+    name = models.CharField(max_length=50)
+    address = models.CharField(max_length=80)
+    star = models.IntegerField()
+
+    class Meta:
+        # filters across the fields of location and restaurant, which no
+        # index of the joined tables can cover
+        indexes = [
+            models.Index(fields=["name"], name="summary_name_idx"),
+            models.Index(fields=["star", "name"], name="summary_star_name_idx"),
+        ]
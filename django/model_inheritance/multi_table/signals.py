@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Location, Restaurant, RestaurantSummary
+
+
+@receiver(post_save, sender=Restaurant)
+def save_restaurant_summary(sender, instance, created, **kwargs):
+    # deletes cascade to the summary; update() of restaurants sends no
+    # signals and leaves the summaries behind
+    values = {
+        "name": instance.name,
+        "address": instance.address,
+        "star": instance.star,
+    }
+    if created or not RestaurantSummary.objects.filter(pk=instance.pk).update(**values):
+        RestaurantSummary.objects.create(restaurant_id=instance.pk, **values)
+
+
+@receiver(post_save, sender=Location)
+def save_location_summary(sender, instance, **kwargs):
+    # a restaurant saved as its Location
+    RestaurantSummary.objects.filter(pk=instance.pk).update(
+        name=instance.name, address=instance.address
+    )
@@ -1,3 +1,124 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from .models import Location, Restaurant, RestaurantSummary
+
+
+class RestaurantSummaryTest(TestCase):
+    def get_summaries(self):
+        return list(
+            RestaurantSummary.objects.order_by("pk").values_list(
+                "pk", "name", "address", "star"
+            )
+        )
+
+    def test_summary_follows_restaurant(self):
+        restaurant = Restaurant.objects.create(name="Rest", address="addr2", star=5)
+        restaurant.star = 4
+        restaurant.save()
+        location = Location.objects.get(pk=restaurant.pk)
+        location.name = "Rest2"
+        location.save()
+        self.assertEqual(self.get_summaries(), [(restaurant.pk, "Rest2", "addr2", 4)])
+
+        Location.objects.get(pk=restaurant.pk).delete()
+        self.assertEqual(self.get_summaries(), [])
+
+    def test_location_has_no_summary(self):
+        Location.objects.create(name="loc", address="adrr")
+        self.assertEqual(self.get_summaries(), [])
+
+    def test_summaries_are_restaurants_without_join(self):
+        restaurant = Restaurant.objects.create(name="Rest", address="addr2", star=5)
+        Restaurant.objects.create(name="Other", address="addr3", star=3)
+        with CaptureQueriesContext(connection) as queries:
+            found = list(Restaurant.summaries.filter(star=5))
+        self.assertNotIn("JOIN", queries[0]["sql"])
+        self.assertEqual(found, [restaurant])
+        self.assertEqual(str(found[0]), "Rest - addr2 - 5")
+
+        # a restaurant read from the summary saves as any other
+        found[0].star = 1
+        found[0].save()
+        self.assertEqual(Restaurant.objects.get(pk=restaurant.pk).star, 1)
+        self.assertEqual(Restaurant.summaries.get(pk=restaurant.pk).star, 1)
+
+    def test_deferred_fields(self):
+        restaurant = Restaurant.objects.create(name="Rest", address="addr2", star=5)
+        found = Restaurant.summaries.only("name").get()
+        self.assertEqual(found.get_deferred_fields(), {"address", "star"})
+        self.assertEqual(found.pk, restaurant.pk)
+
+    def test_summaries_are_read_only(self):
+        with self.assertRaises(TypeError):
+            Restaurant.summaries.update(star=1)
+        with self.assertRaises(TypeError):
+            Restaurant.summaries.all().delete()
+
+
+class PolymorphicLocationTest(TestCase):
+    def create_locations(self, count):
+        for index in range(count):
+            if index % 2:
+                Restaurant.objects.create(name=f"r{index}", address="addr", star=5)
+            else:
+                Location.objects.create(name=f"l{index}", address="addr")
+
+    def test_children_come_as_restaurants(self):
+        self.create_locations(4)
+        with self.assertNumQueries(1):
+            locations = list(Location.objects.polymorphic().order_by("pk"))
+            self.assertEqual(
+                [type(location) for location in locations],
+                [Location, Restaurant, Location, Restaurant],
+            )
+            self.assertEqual(str(locations[1]), "r1 - addr - 5")
+
+    def test_queries_do_not_grow_with_rows(self):
+        for count in [2, 20]:
+            self.create_locations(count)
+            with self.assertNumQueries(1):
+                for location in Location.objects.polymorphic().filter(address="addr"):
+                    if isinstance(location, Restaurant):
+                        location.star
+
+    def test_restaurant_saves(self):
+        self.create_locations(2)
+        restaurant = Location.objects.polymorphic().get(name="r1")
+        restaurant.star = 3
+        restaurant.save()
+        self.assertEqual(Restaurant.objects.get(name="r1").star, 3)
+
+
+class BulkLoadTest(TestCase):
+    def test_restaurants_are_loaded_in_batches(self):
+        Location.objects.create(name="loc", address="adrr")
+        restaurants = [
+            Restaurant(name=f"r{index}", address="addr", star=index)
+            for index in range(5)
+        ]
+        # a batch is the locations, the restaurants and their summaries
+        with self.assertNumQueries(9):
+            loaded = Restaurant.objects.bulk_load(restaurants, batch_size=2)
+        self.assertEqual(loaded, restaurants)
+        self.assertEqual(
+            list(Restaurant.objects.order_by("pk").values_list("pk", "name", "star")),
+            [
+                (restaurant.pk, f"r{index}", index)
+                for index, restaurant in enumerate(loaded)
+            ],
+        )
+        self.assertEqual(
+            list(Restaurant.summaries.order_by("pk")),
+            list(Restaurant.objects.order_by("pk")),
+        )
+
+    def test_loaded_restaurant_saves(self):
+        (restaurant,) = Restaurant.objects.bulk_load(
+            [Restaurant(name="Rest", address="addr2", star=5)]
+        )
+        restaurant.star = 4
+        restaurant.save()
+        self.assertEqual(Restaurant.objects.count(), 1)
+        self.assertEqual(Restaurant.summaries.get().star, 4)
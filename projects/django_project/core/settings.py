@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -74,12 +75,63 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB_PROFILE picks the database of a deployment: "sqlite" for a single
+# node, "postgres" when several app servers share the database
+DB_PROFILE = os.environ.get("DB_PROFILE", "sqlite")
+
+if DB_PROFILE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "play"),
+            "USER": os.environ.get("DB_USER", "postgres"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "localhost"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            # connections stay open between requests and are checked
+            # before they are used again
+            "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+    if os.environ.get("DB_POOL") == "1":
+        # the psycopg 3 pool of django 5.1+ replaces persistent connections
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 20)),
+        }
+    if os.environ.get("DB_PGBOUNCER") == "1":
+        # a transaction pooler hands every transaction its own connection
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+else:
+    # readers do not block the writer in WAL mode, and a commit no longer
+    # waits for the disk: a power cut may lose the last commits but never
+    # corrupts the database
+    SQLITE_WAL = os.environ.get("DB_SQLITE_WAL", "1") == "1"
+    if SQLITE_WAL:
+        SQLITE_PRAGMAS = "PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL"
+    else:
+        SQLITE_PRAGMAS = "PRAGMA journal_mode=DELETE"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # seconds a writer waits for the lock before it fails
+                "timeout": int(os.environ.get("DB_TIMEOUT", 20)),
+                "init_command": SQLITE_PRAGMAS,
+                # a transaction takes the write lock when it begins, so it
+                # waits for the timeout instead of failing at once when it
+                # writes after another writer has committed
+                "transaction_mode": "IMMEDIATE",
+            },
+            # the in-memory test database fails at once on a lock instead of
+            # waiting for it, which breaks tests running queries from threads
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+        }
     }
-}
 
 
 # Password validation
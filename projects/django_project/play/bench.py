@@ -0,0 +1,340 @@
+# run from the django_project directory: python manage.py bench indexes
+# every benchmark leaves the database as it was, most work inside a
+# transaction that is rolled back
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import get_room_cache
+from .matchmaking import Matchmaker
+from .models import RoomGameModel
+
+
+class Rollback(Exception):
+    pass
+
+
+def fill_rooms(count, users, active=1000, batch_size=10000):
+    # finished games between random users, then a few active rooms of
+    # which every other one still waits for its second player; plain
+    # executemany, bulk_create is several times slower at this size
+    rng = random.Random(0)
+    now = timezone.now()
+    # finished up to a year ago
+    times = [
+        connection.ops.adapt_datetimefield_value(now - timedelta(days=day))
+        for day in range(366)
+    ]
+    rows = [
+        (str(rng.randrange(users)), str(rng.randrange(users)), False, rng.choice(times))
+        for _ in range(count)
+    ]
+    rows += [
+        (f"a{room}", f"b{room}" if room % 2 else None, True, times[0])
+        for room in range(active)
+    ]
+
+    table = RoomGameModel._meta.db_table
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(
+                f"INSERT INTO {table} (user1, user2, is_active, updated_at) "
+                f"VALUES (%s, %s, %s, %s)",
+                rows[start : start + batch_size],
+            )
+        cursor.execute(f"ANALYZE {table}")
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def time_query(run, repeat):
+    start = time.perf_counter()
+    for index in range(repeat):
+        run(index)
+    return (time.perf_counter() - start) / repeat
+
+
+def explain(queryset, label):
+    # sqlite keeps prepared statements and would show the plan from before
+    # the indexes changed, the label makes the statement a new one
+    sql, params = queryset.query.sql_with_params()
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql} /* {label} */", params)
+        return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def drop_indexes(model):
+    # the schema editor refuses to run inside a transaction on sqlite
+    with connection.cursor() as cursor:
+        for index in model._meta.indexes:
+            cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+
+
+def bench_indexes(options):
+    rooms = RoomGameModel.rooms
+    # what the hot paths run, the first room in pk order
+    queries = {
+        "user_rooms": lambda index: rooms.user_rooms(f"a{index % 1000}"),
+        "waiting_rooms": lambda index: rooms.waiting_rooms(),
+    }
+
+    try:
+        with transaction.atomic():
+            start = time.perf_counter()
+            fill_rooms(options["rooms"], options["rooms"] // 10)
+            print(f"{options['rooms']} rooms in {time.perf_counter() - start:.1f} s")
+
+            for name in ["indexes", "no indexes"]:
+                if name == "no indexes":
+                    drop_indexes(RoomGameModel)
+                print(f"{name}:")
+                for query, get_queryset in queries.items():
+                    spent = time_query(
+                        lambda index: get_queryset(index).first(), options["repeat"]
+                    )
+                    print(f"  {query:>14}: {spent * 1e3:8.3f} ms")
+                    queryset = get_queryset(1).order_by("pk")[:1]
+                    for line in explain(queryset, name):
+                        print(f"  {'':>14}  {line}")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def bench_matchmaking(options):
+    # every player joins once; with the matchmaker the first of a pair only
+    # learns about the room on its next join, which is not counted
+    joins = options["repeat"]
+    matchmaker = Matchmaker()
+    paths = {
+        "create_room": RoomGameModel.rooms.create_room,
+        "matchmaker": matchmaker.join,
+    }
+
+    try:
+        with transaction.atomic():
+            fill_rooms(options["rooms"], options["rooms"] // 10, active=0)
+            for name, join in paths.items():
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries):
+                    start = time.perf_counter()
+                    for user in range(joins):
+                        join(f"{name}{user}")
+                    spent = time.perf_counter() - start
+
+                print(
+                    f"{name:>11}: {joins / spent:8.0f} joins/s, "
+                    f"{queries.count / joins:4.1f} queries/join"
+                )
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def bench_archive(options):
+    rooms = RoomGameModel.rooms
+    queries = {
+        # create_room makes rooms, each pass gets its own users
+        "create_room": lambda name, index: rooms.create_room(f"{name}{index}"),
+        "user_rooms": lambda name, index: rooms.user_rooms(f"a{index % 1000}").first(),
+        "count": lambda name, index: rooms.count(),
+    }
+    repeat = options["repeat"]
+
+    try:
+        with transaction.atomic():
+            fill_rooms(options["rooms"], options["rooms"] // 10)
+            for name in ["before", "after"]:
+                if name == "after":
+                    start = time.perf_counter()
+                    moved = rooms.archive(timezone.now() - timedelta(days=30))
+                    spent = time.perf_counter() - start
+                    print(f"archived {moved} rooms in {spent:.1f} s")
+
+                print(f"{name}: {rooms.count()} rooms")
+                for query, run in queries.items():
+                    spent = time_query(lambda index: run(name, index), repeat)
+                    print(f"  {query:>11}: {spent * 1e3:8.3f} ms")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def bench_cache(options):
+    # reads inside a transaction are not cached, so the rooms are committed
+    # and deleted again at the end
+    rooms = RoomGameModel.rooms
+    last = rooms.order_by("-pk").values_list("pk", flat=True).first() or 0
+    cache = get_room_cache()
+    cache.clear()
+
+    try:
+        with transaction.atomic():
+            fill_rooms(options["rooms"], options["rooms"] // 10)
+
+        for name in ["cold", "warm"]:
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                spent = time_query(
+                    lambda index: rooms.get_user_active_room(f"a{index % 1000}"),
+                    options["repeat"],
+                )
+            print(
+                f"{name:>4}: {spent * 1e3:8.3f} ms, "
+                f"{queries.count / options['repeat']:4.2f} queries/lookup"
+            )
+        print(cache.metrics())
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {RoomGameModel._meta.db_table} WHERE id > %s", [last]
+            )
+
+
+def create_rooms(thread, repeat, barrier, latencies, errors):
+    barrier.wait()
+    try:
+        for index in range(repeat):
+            start = time.perf_counter()
+            try:
+                RoomGameModel.rooms.create_room(f"load{thread}-{index}")
+            except Exception as error:
+                errors.append(error)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connection.close()
+
+
+def bench_load(options):
+    # threads create rooms at the same time on committed data, so the rooms
+    # are deleted again at the end; run it once per DB_PROFILE
+    threads = options["threads"]
+    repeat = options["repeat"]
+    last = RoomGameModel.rooms.order_by("-pk").values_list("pk", flat=True).first()
+    last = last or 0
+    barrier = threading.Barrier(threads)
+    latencies = []
+    errors = []
+
+    try:
+        workers = [
+            threading.Thread(
+                target=create_rooms, args=[thread, repeat, barrier, latencies, errors]
+            )
+            for thread in range(threads)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        spent = time.perf_counter() - start
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {RoomGameModel._meta.db_table} WHERE id > %s", [last]
+            )
+
+    latencies.sort()
+    profile = settings.DB_PROFILE
+    if profile == "sqlite":
+        profile += " wal" if settings.SQLITE_WAL else " rollback journal"
+    print(
+        f"{profile}, {threads} threads: "
+        f"{(len(latencies) - len(errors)) / spent:6.0f} joins/s, "
+        f"p50 {latencies[len(latencies) // 2] * 1e3:6.2f} ms, "
+        f"p99 {latencies[len(latencies) * 99 // 100] * 1e3:6.2f} ms, "
+        f"{len(errors)} errors"
+    )
+
+
+def close_each(rooms, ids, users):
+    for room in rooms.filter(pk__in=ids):
+        room.is_active = False
+        room.save(update_fields=["is_active", "updated_at"])
+
+
+def detach_each(rooms, ids, users):
+    for user in users:
+        for room in rooms.user_rooms(user):
+            if room.user2 is None:
+                room.is_active = False
+            elif room.user1 == user:
+                room.user1, room.user2 = room.user2, None
+            else:
+                room.user2 = None
+            room.save(update_fields=["user1", "user2", "is_active", "updated_at"])
+
+
+def pair_each(rooms, ids, users):
+    for user in users:
+        rooms.create_room(f"new{user}")
+
+
+def bench_bulk(options):
+    # every operation on --repeat active rooms, once a room at a time and
+    # once with the bulk api, each from the same rooms
+    rooms = RoomGameModel.rooms
+    count = options["repeat"]
+    operations = {
+        "close": [close_each, lambda rooms, ids, users: rooms.close_rooms(ids)],
+        "detach": [
+            detach_each,
+            lambda rooms, ids, users: rooms.detach_users(users),
+        ],
+        "pair": [
+            pair_each,
+            lambda rooms, ids, users: rooms.pair_users(
+                [f"new{user}" for user in users]
+            ),
+        ],
+    }
+
+    try:
+        with transaction.atomic():
+            fill_rooms(options["rooms"], options["rooms"] // 10, active=count)
+            ids = list(rooms.active().values_list("pk", flat=True))
+            users = [f"a{room}" for room in range(count)]
+
+            for operation, runs in operations.items():
+                for name, run in zip(["each", "bulk"], runs):
+                    queries = QueryCounter()
+                    try:
+                        with transaction.atomic():
+                            with connection.execute_wrapper(queries):
+                                start = time.perf_counter()
+                                run(rooms, ids, users)
+                                spent = time.perf_counter() - start
+                            raise Rollback
+                    except Rollback:
+                        pass
+                    print(
+                        f"{operation:>6} {name}: {spent * 1e3:9.1f} ms, "
+                        f"{queries.count:6} queries"
+                    )
+            raise Rollback
+    except Rollback:
+        pass
+
+
+BENCHMARKS = {
+    "indexes": bench_indexes,
+    "matchmaking": bench_matchmaking,
+    "archive": bench_archive,
+    "cache": bench_cache,
+    "load": bench_load,
+    "bulk": bench_bulk,
+}
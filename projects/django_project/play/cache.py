@@ -0,0 +1,184 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+
+
+class LocalCache:
+    # the calls of django's cache api RoomCache makes, as an LRU of at most
+    # size entries in this process
+    def __init__(self, size=10000, clock=time.monotonic):
+        self.size = size
+        self.clock = clock
+        self.lock = threading.Lock()
+        # key -> (value, expiry time), oldest first
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires <= self.clock():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.set_entry(key, value, timeout)
+
+    def add(self, key, value, timeout):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > self.clock():
+                return False
+            self.set_entry(key, value, timeout)
+            return True
+
+    def set_entry(self, key, value, timeout):
+        self.entries[key] = (value, self.clock() + timeout)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RoomCache:
+    # the active room of every user, None for a user without one; every
+    # invalidation changes a version of the user and a room is cached with
+    # the version read before it was loaded, so a room read from the
+    # database while it was changing never matches the version again
+    def __init__(self, cache, timeout=300, prefix="room"):
+        self.cache = cache
+        self.timeout = timeout
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        # the versions the invalidations of this thread set once they commit
+        self.local = threading.local()
+
+    def get_key(self, user):
+        return f"{self.prefix}:{user}"
+
+    def get_version_key(self, user):
+        return f"{self.prefix}:{user}:version"
+
+    def get_version(self, user):
+        # a user without a version gets one, so a cached room never matches
+        # a version that was dropped from the cache
+        version_key = self.get_version_key(user)
+        self.cache.add(version_key, uuid.uuid4().hex, self.timeout)
+        return self.cache.get(version_key)
+
+    def get_pending_versions(self):
+        if not hasattr(self.local, "versions"):
+            self.local.versions = {}
+        return self.local.versions
+
+    def get(self, user, load):
+        key = self.get_key(user)
+        version_key = self.get_version_key(user)
+        values = self.cache.get_many([key, version_key])
+        cached = values.get(key)
+        version = values.get(version_key)
+        if cached is not None and version is not None and cached[1] == version:
+            self.hits += 1
+            return copy.copy(cached[0])
+
+        self.misses += 1
+        if version is None:
+            version = self.get_version(user)
+        room = load(user)
+        # what a transaction reads may still be rolled back
+        if connection.in_atomic_block:
+            return room
+        self.cache.set(key, (room, version), self.timeout)
+        return room
+
+    def set(self, user, room):
+        # the version is read now, like get does: an invalidation another
+        # transaction commits before this one makes the room stale, while
+        # the invalidations of this transaction already chose the version
+        # they will set; one that was rolled back only costs a miss
+        pending = self.get_pending_versions()
+        version = pending.get(user) if connection.in_atomic_block else None
+        if version is None:
+            version = self.get_version(user)
+        transaction.on_commit(
+            lambda: self.cache.set(self.get_key(user), (room, version), self.timeout)
+        )
+
+    def invalidate(self, *users):
+        pending = self.get_pending_versions()
+        versions = {user: uuid.uuid4().hex for user in users if user is not None}
+        pending.update(versions)
+
+        def delete():
+            for user, version in versions.items():
+                self.cache.delete(self.get_key(user))
+                self.cache.set(self.get_version_key(user), version, self.timeout)
+                if pending.get(user) == version:
+                    del pending[user]
+
+        transaction.on_commit(delete)
+
+    def clear(self):
+        # clears the whole cache it is kept in
+        self.cache.clear()
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+        }
+
+
+room_cache = None
+
+
+def get_room_cache():
+    # ROOM_CACHE_ALIAS names a django cache shared by all processes, without
+    # it every process keeps its own LRU of ROOM_CACHE_SIZE users
+    global room_cache
+    if room_cache is None:
+        alias = getattr(settings, "ROOM_CACHE_ALIAS", None)
+        if alias is not None:
+            cache = caches[alias]
+        else:
+            cache = LocalCache(getattr(settings, "ROOM_CACHE_SIZE", 10000))
+        room_cache = RoomCache(cache, getattr(settings, "ROOM_CACHE_TIMEOUT", 300))
+    return room_cache
+
+
+@receiver(setting_changed)
+def reset_room_cache(setting, **kwargs):
+    global room_cache
+    if setting.startswith("ROOM_CACHE"):
+        room_cache = None
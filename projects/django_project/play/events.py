@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+from django.db import transaction
+from django.dispatch import Signal
+
+# sent in the process that committed a room left waiting for a player
+room_waiting = Signal()
+
+
+class RoomEvents:
+    # changes of rooms for the views waiting on them in this process; rooms
+    # change in sync code on any thread, the views wait on event loops, so
+    # every event is handed to the loop of its subscriber
+    def __init__(self):
+        self.lock = threading.Lock()
+        # room id -> set of (loop, queue)
+        self.subscribers = {}
+
+    def subscribe(self, room_id):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            self.subscribers.setdefault(room_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, room_id, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(room_id, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self.subscribers.pop(room_id, None)
+
+    def publish(self, room_id, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(room_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # the loop of a subscriber that went away is closed
+                self.unsubscribe(room_id, (loop, queue))
+
+
+room_events = RoomEvents()
+
+
+def get_room_event(room):
+    return {
+        "id": room.pk,
+        "user1": room.user1,
+        "user2": room.user2,
+        "is_active": room.is_active,
+    }
+
+
+def is_waiting(event):
+    return event["is_active"] and event["user2"] is None
+
+
+def publish_room(room):
+    # only what was committed is published
+    event = get_room_event(room)
+
+    def publish():
+        room_events.publish(room.pk, event)
+        if is_waiting(event):
+            room_waiting.send(sender=type(room), room_id=room.pk)
+
+    transaction.on_commit(publish)
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from play.models import RoomGameModel
+
+
+class Command(BaseCommand):
+    help = "Moves finished rooms to the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=float,
+            default=30,
+            help="archive rooms finished more than this many days ago",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        moved = RoomGameModel.rooms.archive(before, options["batch_size"])
+        self.stdout.write(f"Archived {moved} rooms")
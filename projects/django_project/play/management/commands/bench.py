@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from play.bench import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Runs a benchmark of the rooms, the database is left as it was"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=BENCHMARKS)
+        parser.add_argument("--rooms", type=int, default=1000000)
+        parser.add_argument("--repeat", type=int, default=1000)
+        parser.add_argument("--threads", type=int, default=8)
+
+    def handle(self, *args, **options):
+        BENCHMARKS[options["name"]](options)
@@ -0,0 +1,143 @@
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+
+from .events import room_waiting
+from .models import RoomGameModel
+
+
+class LocalQueue:
+    # a second player is always paired at once, so at most one player
+    # ever waits and the queue is a single slot
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = None
+        # paired players who have not found their room yet
+        self.pairing = set()
+
+    def pair(self, user):
+        # returns the player the user is paired with, None when the user
+        # is left waiting
+        with self.lock:
+            if user in self.pairing:
+                return None
+            if self.waiting is None or self.waiting == user:
+                self.waiting = user
+                return None
+            other, self.waiting = self.waiting, None
+            self.pairing.add(other)
+            return other
+
+    def done(self, user):
+        with self.lock:
+            self.pairing.discard(user)
+
+    def leave(self, user):
+        with self.lock:
+            if self.waiting == user:
+                self.waiting = None
+
+
+class CacheQueue:
+    # the same slot in a django cache shared by all processes; the cache
+    # has no atomic swap, so the slot is guarded by a lock taken with add
+    def __init__(self, alias="default", key="matchmaking", timeout=600):
+        self.cache = caches[alias]
+        self.key = key
+        self.lock_key = f"{key}:lock"
+        self.timeout = timeout
+
+    def acquire(self):
+        token = uuid.uuid4().hex
+        while not self.cache.add(self.lock_key, token, timeout=5):
+            time.sleep(0.001)
+        return token
+
+    def release(self, token):
+        if self.cache.get(self.lock_key) == token:
+            self.cache.delete(self.lock_key)
+
+    def get_pairing_key(self, user):
+        return f"{self.key}:pairing:{user}"
+
+    def pair(self, user):
+        token = self.acquire()
+        try:
+            if self.cache.get(self.get_pairing_key(user)) is not None:
+                return None
+            waiting = self.cache.get(self.key)
+            if waiting is None or waiting == user:
+                self.cache.set(self.key, user, timeout=self.timeout)
+                return None
+            self.cache.delete(self.key)
+            self.cache.set(self.get_pairing_key(waiting), user, timeout=self.timeout)
+            return waiting
+        finally:
+            self.release(token)
+
+    def done(self, user):
+        self.cache.delete(self.get_pairing_key(user))
+
+    def leave(self, user):
+        token = self.acquire()
+        try:
+            if self.cache.get(self.key) == user:
+                self.cache.delete(self.key)
+        finally:
+            self.release(token)
+
+
+class Matchmaker:
+    # players wait in the queue instead of in a half empty room, so only
+    # the complete room is written, with a single INSERT; rooms left
+    # waiting in the database by create_room, detach_user or before a
+    # restart are claimed first; when there are none, claims start again
+    # as soon as a room of this process is left waiting, and every recheck
+    # seconds for the rooms of other processes
+    def __init__(self, queue=None, recheck=5, clock=time.monotonic):
+        self.queue = queue if queue is not None else LocalQueue()
+        self.has_waiting_rooms = True
+        self.recheck = recheck
+        self.clock = clock
+        self.checked_at = None
+        room_waiting.connect(self.room_waiting)
+
+    def room_waiting(self, **kwargs):
+        self.has_waiting_rooms = True
+
+    def should_claim(self):
+        return self.has_waiting_rooms or self.clock() - self.checked_at > self.recheck
+
+    def join(self, user):
+        # returns the room of the user, None while waiting for a player
+        if self.should_claim():
+            # also finds the room the user already has
+            room = RoomGameModel.rooms.claim_room(user)
+            self.has_waiting_rooms = room is not None
+            if room is None:
+                self.checked_at = self.clock()
+        else:
+            room = RoomGameModel.rooms.get_user_room(user)
+        if room is not None:
+            self.queue.done(user)
+            if room.user2 is None:
+                # the user waits in its own room for the next one to claim
+                self.has_waiting_rooms = True
+                return None
+            return room
+
+        # a paired player keeps waiting and is never paired again until it
+        # finds its room, even when it looked just before it was written
+        other = self.queue.pair(user)
+        if other is None:
+            return None
+        try:
+            return RoomGameModel.rooms.create(user1=other, user2=user)
+        except Exception:
+            self.queue.done(other)
+            raise
+
+    def leave(self, user):
+        self.queue.leave(user)
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("play", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="roomgamemodel",
+            managers=[
+                ("rooms", django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="roomgamemodel",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["user1"],
+                name="room_active_user1_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="roomgamemodel",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["user2"],
+                name="room_active_user2_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="roomgamemodel",
+            index=models.Index(
+                condition=models.Q(("is_active", True), ("user2", None)),
+                fields=["id"],
+                name="room_waiting_idx",
+            ),
+        ),
+    ]
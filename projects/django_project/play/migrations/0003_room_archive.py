@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("play", "0002_room_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedRoomModel",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("user1", models.CharField(blank=True, max_length=30, null=True)),
+                ("user2", models.CharField(blank=True, max_length=30, null=True)),
+                ("updated_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="roomgamemodel",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
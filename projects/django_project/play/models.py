@@ -1,5 +1,10 @@
-from django.db import models
-from django.db.models import Q
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Case, Exists, F, Q, Subquery, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .cache import get_room_cache
+from .events import publish_room
 
 
 class RoomManager(models.Manager):
@@ -9,34 +14,278 @@ class RoomManager(models.Manager):
     def empty_rooms(self):
         return self.active().filter(Q(user1=None) | Q(user2=None))
 
+    def waiting_rooms(self):
+        # rooms are created with user1, so a room waits for its user2
+        return self.active().filter(user2=None)
+
+    def user_rooms(self, user):
+        # is_active goes into both sides of the OR, so each side matches
+        # the condition of its partial index
+        return (
+            super()
+            .get_queryset()
+            .filter(Q(is_active=True, user1=user) | Q(is_active=True, user2=user))
+        )
+
+    def get_user_room(self, user):
+        # the active room of the user or None, cached until a room of the
+        # user changes
+        return get_room_cache().get(user, lambda user: self.user_rooms(user).first())
+
     def is_user_have_active_room(self, user):
-        return self.active().filter(Q(user1=user) | Q(user2=user)).exists()
+        return self.get_user_room(user) is not None
 
     def get_user_active_room(self, user):
-        return self.active().get(Q(user1=user) | Q(user2=user))
+        room = self.get_user_room(user)
+        if room is None:
+            raise self.model.DoesNotExist(f"User {user} has no active room")
+        return room
+
+    def claim_room(self, user):
+        # the claim is a single conditional UPDATE: it only takes a room
+        # that is still waiting and only when the user has no room yet, so
+        # two joiners can never get the same room; locked rooms are skipped
+        # instead of waited for where the database can lock rows
+        with transaction.atomic(savepoint=False):
+            waiting = (
+                self.waiting_rooms()
+                .order_by("pk")
+                .select_for_update(skip_locked=True)
+                .values("pk")[:1]
+            )
+            claimed = (
+                self.waiting_rooms()
+                .filter(~Exists(self.user_rooms(user)), pk__in=Subquery(waiting))
+                .update(user2=user, updated_at=Now())
+            )
+
+            # the room the user had before or has just joined
+            room = self.user_rooms(user).first()
+            if claimed:
+                get_room_cache().invalidate(room.user1, user)
+                publish_room(room)
+            return room
 
     def create_room(self, user):
-        if self.is_user_have_active_room(user):
-            return self.get_user_active_room(user)
+        with transaction.atomic():
+            room = self.claim_room(user)
+            if room is None:
+                room = super().create(user1=user)
+            get_room_cache().set(user, room)
+            return room
 
-        room = self.empty_rooms().first()
-        if not room:
-            return super().create(user1=user)
+    def close_rooms(self, ids):
+        # finishes the given rooms with a single UPDATE; returns the number
+        # of rooms closed
+        with transaction.atomic(savepoint=False):
+            rooms = list(
+                self.active()
+                .filter(pk__in=ids)
+                .select_for_update()
+                .only("user1", "user2")
+            )
+            closed = (
+                self.active()
+                .filter(pk__in=[room.pk for room in rooms])
+                .update(is_active=False, updated_at=Now())
+            )
 
-        room.user2 = user
-        room.save()
-        return room
+            # update() sends no signals
+            users = []
+            for room in rooms:
+                room.is_active = False
+                users += [room.user1, room.user2]
+                publish_room(room)
+            get_room_cache().invalidate(*users)
+            return closed
+
+    def detach_users(self, users):
+        # takes the users out of their rooms with a single UPDATE: the other
+        # player stays as user1 and waits for a new partner, a room left
+        # with no player is closed; returns the number of rooms changed
+        users = list(users)
+        gone1 = Q(user1__in=users)
+        gone2 = Q(user2__in=users)
+        empty = gone1 & (Q(user2=None) | gone2)
+        with transaction.atomic(savepoint=False):
+            rooms = list(
+                super()
+                .get_queryset()
+                .filter(
+                    Q(is_active=True, user1__in=users)
+                    | Q(is_active=True, user2__in=users)
+                )
+                .select_for_update()
+                .only("user1", "user2", "is_active")
+            )
+            if not rooms:
+                return 0
+
+            # the rows are locked, the UPDATE finds them by pk
+            detached = (
+                super()
+                .get_queryset()
+                .filter(pk__in=[room.pk for room in rooms])
+                .update(
+                    user1=Case(
+                        When(empty, then=F("user1")),
+                        When(gone1, then=F("user2")),
+                        default=F("user1"),
+                    ),
+                    user2=Case(When(empty, then=F("user2")), default=None),
+                    is_active=Case(When(empty, then=Value(False)), default=Value(True)),
+                    updated_at=Now(),
+                )
+            )
+
+            # the same changes on the rooms read, update() sends no signals
+            gone = set(users)
+            changed = list(users)
+            for room in rooms:
+                if room.user1 in gone and (room.user2 is None or room.user2 in gone):
+                    room.is_active = False
+                elif room.user1 in gone:
+                    room.user1, room.user2 = room.user2, None
+                else:
+                    room.user2 = None
+                changed.append(room.user1)
+                publish_room(room)
+            get_room_cache().invalidate(*changed)
+            return detached
+
+    def detach_user(self, user):
+        return self.detach_users([user])
+
+    def pair_users(self, users):
+        # create_room for many users at once: waiting rooms are claimed with
+        # one bulk_update, the users left are paired into new rooms with one
+        # bulk_create, an odd one out waits in a room of its own; users who
+        # already have a room are skipped; returns the number of rooms
+        # written
+        users = list(dict.fromkeys(users))
+        with transaction.atomic(savepoint=False):
+            busy = set()
+            for user1, user2 in (
+                super()
+                .get_queryset()
+                .filter(
+                    Q(is_active=True, user1__in=users)
+                    | Q(is_active=True, user2__in=users)
+                )
+                .values_list("user1", "user2")
+            ):
+                busy.update([user1, user2])
+            users = [user for user in users if user not in busy]
+
+            waiting = list(
+                self.waiting_rooms()
+                .order_by("pk")
+                .select_for_update(skip_locked=True)[: len(users)]
+            )
+            now = timezone.now()
+            for room, user in zip(waiting, users):
+                room.user2 = user
+                room.updated_at = now
+            # only rooms that still wait are claimed, as in claim_room
+            claimed = self.waiting_rooms().bulk_update(waiting, ["user2", "updated_at"])
+            if claimed != len(waiting):
+                raise IntegrityError("A waiting room was claimed meanwhile")
+
+            users = users[len(waiting) :]
+            created = self.bulk_create(
+                [
+                    self.model(user1=user1, user2=user2)
+                    for user1, user2 in zip(users[::2], users[1::2] + [None])
+                ]
+            )
+
+            users = []
+            for room in waiting + created:
+                users += [room.user1, room.user2]
+                publish_room(room)
+            get_room_cache().invalidate(*users)
+            return claimed + len(created)
+
+    def archive(self, before, batch_size=1000):
+        # moves finished rooms last changed before the given time to the
+        # archive, one batch of ids per transaction so the table is never
+        # locked for long; returns the number of rooms moved
+        rooms = self.model._meta.db_table
+        archive = ArchivedRoomModel._meta.db_table
+        finished = super().get_queryset().filter(is_active=False, updated_at__lt=before)
+
+        last = 0
+        moved = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    finished.filter(pk__gt=last)
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[:batch_size]
+                )
+                if not ids:
+                    return moved
+
+                # INSERT ... SELECT, the SELECT built by the queryset
+                select, params = (
+                    finished.filter(pk__gt=last, pk__lte=ids[-1])
+                    .values_list("id", "user1", "user2", "updated_at")
+                    .query.sql_with_params()
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"INSERT INTO {archive} (id, user1, user2, updated_at) {select}",
+                        params,
+                    )
+                    # only what made it to the archive is deleted
+                    cursor.execute(
+                        f"DELETE FROM {rooms} WHERE id IN "
+                        f"(SELECT id FROM {archive} WHERE id > %s AND id <= %s)",
+                        [last, ids[-1]],
+                    )
+                    moved += cursor.rowcount
+                last = ids[-1]
 
 
 class RoomGameModel(models.Model):
     user1 = models.CharField(max_length=30, blank=True, null=True)
     user2 = models.CharField(max_length=30, blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
     # turn = models.CharField(max_length=30)
 
     rooms = RoomManager()
 
+    class Meta:
+        # every RoomManager query is on active rooms, which stay few while
+        # finished ones pile up, so the indexes only cover active rows
+        indexes = [
+            models.Index(
+                fields=["user1"],
+                condition=Q(is_active=True),
+                name="room_active_user1_idx",
+            ),
+            models.Index(
+                fields=["user2"],
+                condition=Q(is_active=True),
+                name="room_active_user2_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=Q(is_active=True, user2=None),
+                name="room_waiting_idx",
+            ),
+        ]
+
     def has_capacity(self):
         if self.user1 is not None and self.user2 is not None:
             return False
         return True
+
+
+class ArchivedRoomModel(models.Model):
+    # finished rooms moved out of RoomGameModel, with the same ids
+    id = models.BigIntegerField(primary_key=True)
+    user1 = models.CharField(max_length=30, blank=True, null=True)
+    user2 = models.CharField(max_length=30, blank=True, null=True)
+    updated_at = models.DateTimeField()
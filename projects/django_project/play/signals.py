@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import get_room_cache
+from .events import publish_room
+from .models import RoomGameModel
+
+
+@receiver([post_save, post_delete], sender=RoomGameModel)
+def invalidate_room_users(sender, instance, **kwargs):
+    # update() does not send signals, RoomManager invalidates those itself
+    get_room_cache().invalidate(instance.user1, instance.user2)
+
+
+@receiver(post_save, sender=RoomGameModel)
+def publish_room_change(sender, instance, **kwargs):
+    # a finished game among others; update() does not send signals,
+    # RoomManager publishes those itself
+    publish_room(instance)
@@ -1,3 +1,458 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .cache import LocalCache, RoomCache, get_room_cache
+from .events import room_events
+from .matchmaking import CacheQueue, Matchmaker
+from .models import ArchivedRoomModel, RoomGameModel
+
+
+class RoomCacheMixin:
+    # rooms of other tests are gone, their users may still be cached
+    def setUp(self):
+        super().setUp()
+        get_room_cache().clear()
+
+
+class CreateRoomTest(RoomCacheMixin, TestCase):
+    def test_first_user_waits_in_new_room(self):
+        room = RoomGameModel.rooms.create_room("1")
+        self.assertEqual((room.user1, room.user2), ("1", None))
+        self.assertTrue(room.has_capacity())
+
+    def test_second_user_joins_waiting_room(self):
+        first = RoomGameModel.rooms.create_room("1")
+        second = RoomGameModel.rooms.create_room("2")
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual((second.user1, second.user2), ("1", "2"))
+
+    def test_user_gets_own_room_back(self):
+        room = RoomGameModel.rooms.create_room("1")
+        self.assertEqual(RoomGameModel.rooms.create_room("1").pk, room.pk)
+        RoomGameModel.rooms.create_room("2")
+        self.assertEqual(RoomGameModel.rooms.create_room("2").pk, room.pk)
+        self.assertEqual(RoomGameModel.rooms.count(), 1)
+
+    def test_inactive_room_is_not_joined(self):
+        room = RoomGameModel.rooms.create_room("1")
+        room.is_active = False
+        room.save()
+        self.assertNotEqual(RoomGameModel.rooms.create_room("2").pk, room.pk)
+
+    def test_join_takes_two_queries(self):
+        RoomGameModel.rooms.create_room("1")
+        with CaptureQueriesContext(connection) as queries:
+            RoomGameModel.rooms.create_room("2")
+        # the claiming UPDATE and the SELECT of the room; the transaction of
+        # create_room is a savepoint inside the one of the test
+        statements = [
+            query["sql"].split()[0]
+            for query in queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(statements, ["UPDATE", "SELECT"])
+
+
+class CreateRoomConcurrencyTest(RoomCacheMixin, TransactionTestCase):
+    users = 40
+
+    def join(self, barrier, user, rooms, errors):
+        try:
+            barrier.wait()
+            rooms[user] = RoomGameModel.rooms.create_room(user).pk
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def test_no_room_is_booked_twice(self):
+        barrier = threading.Barrier(self.users)
+        rooms = {}
+        errors = []
+        threads = [
+            threading.Thread(target=self.join, args=[barrier, str(user), rooms, errors])
+            for user in range(self.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for user, pk in rooms.items():
+            room = RoomGameModel.rooms.get(pk=pk)
+            self.assertIn(user, [room.user1, room.user2])
+            self.assertEqual(RoomGameModel.rooms.user_rooms(user).count(), 1)
+        self.assertEqual(len(rooms), self.users)
+
+    @skipUnless(connection.vendor == "sqlite", "sqlite pragmas")
+    def test_sqlite_journal_mode(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+        self.assertEqual(journal_mode, "wal" if settings.SQLITE_WAL else "delete")
+
+
+class ArchiveTest(RoomCacheMixin, TestCase):
+    def test_old_finished_rooms_are_moved(self):
+        now = timezone.now()
+        rooms = []
+        for user in range(7):
+            room = RoomGameModel.rooms.create(user1=str(user), user2="0")
+            rooms.append(room)
+        RoomGameModel.rooms.filter(pk__in=[room.pk for room in rooms[:5]]).update(
+            is_active=False, updated_at=now - timedelta(days=40)
+        )
+        # finished, but not long ago
+        RoomGameModel.rooms.filter(pk=rooms[5].pk).update(is_active=False)
+
+        moved = RoomGameModel.rooms.archive(now - timedelta(days=30), batch_size=2)
+        self.assertEqual(moved, 5)
+        self.assertEqual(
+            list(RoomGameModel.rooms.values_list("pk", flat=True).order_by("pk")),
+            [rooms[5].pk, rooms[6].pk],
+        )
+        archived = ArchivedRoomModel.objects.order_by("pk")
+        self.assertEqual(
+            [(room.pk, room.user1) for room in archived],
+            [(room.pk, room.user1) for room in rooms[:5]],
+        )
+
+    def test_claim_updates_updated_at(self):
+        room = RoomGameModel.rooms.create_room("1")
+        RoomGameModel.rooms.filter(pk=room.pk).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertGreater(
+            RoomGameModel.rooms.create_room("2").updated_at, room.updated_at
+        )
+
+
+class BulkRoomTest(RoomCacheMixin, TestCase):
+    def get_rooms(self):
+        return list(
+            RoomGameModel.rooms.order_by("pk").values_list(
+                "user1", "user2", "is_active"
+            )
+        )
+
+    def test_close_rooms(self):
+        rooms = [RoomGameModel.rooms.create(user1=str(user)) for user in range(3)]
+        self.assertTrue(RoomGameModel.rooms.is_user_have_active_room("0"))
+        with self.assertNumQueries(2):
+            closed = RoomGameModel.rooms.close_rooms([rooms[0].pk, rooms[1].pk])
+        self.assertEqual(closed, 2)
+        self.assertEqual(
+            [is_active for _, _, is_active in self.get_rooms()], [False, False, True]
+        )
+        # closing again changes nothing
+        self.assertEqual(RoomGameModel.rooms.close_rooms([rooms[0].pk]), 0)
+
+    def test_detach_user(self):
+        RoomGameModel.rooms.create(user1="1", user2="2")
+        RoomGameModel.rooms.create(user1="3", user2="1")
+        RoomGameModel.rooms.create(user1="1")
+        RoomGameModel.rooms.create(user1="4", user2="5")
+        with self.assertNumQueries(2):
+            self.assertEqual(RoomGameModel.rooms.detach_user("1"), 3)
+        self.assertEqual(
+            self.get_rooms(),
+            [
+                ("2", None, True),
+                ("3", None, True),
+                ("1", None, False),
+                ("4", "5", True),
+            ],
+        )
+        self.assertEqual(RoomGameModel.rooms.detach_user("1"), 0)
+
+    def test_detach_users(self):
+        RoomGameModel.rooms.create(user1="1", user2="2")
+        RoomGameModel.rooms.create(user1="3", user2="4")
+        RoomGameModel.rooms.create(user1="5", user2="6")
+        self.assertEqual(RoomGameModel.rooms.detach_users(["1", "2", "4"]), 2)
+        self.assertEqual(
+            self.get_rooms(),
+            [("1", "2", False), ("3", None, True), ("5", "6", True)],
+        )
+        self.assertEqual(RoomGameModel.rooms.get_user_room("3").user2, None)
+
+    def test_pair_users(self):
+        waiting = RoomGameModel.rooms.create(user1="1")
+        RoomGameModel.rooms.create(user1="2", user2="3")
+        self.assertEqual(
+            RoomGameModel.rooms.pair_users(["3", "4", "5", "6", "7", "5"]), 3
+        )
+        self.assertEqual(
+            self.get_rooms(),
+            [
+                ("1", "4", True),
+                ("2", "3", True),
+                ("5", "6", True),
+                ("7", None, True),
+            ],
+        )
+        self.assertEqual(RoomGameModel.rooms.get_user_room("4").pk, waiting.pk)
+        # the room of 7 waits for create_room
+        self.assertEqual(RoomGameModel.rooms.create_room("8").user1, "7")
+
+
+class MatchmakerTest(RoomCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.matchmaker = Matchmaker()
+
+    def test_room_is_written_when_complete(self):
+        self.assertIsNone(self.matchmaker.join("1"))
+        self.assertEqual(RoomGameModel.rooms.count(), 0)
+        room = self.matchmaker.join("2")
+        self.assertEqual((room.user1, room.user2), ("1", "2"))
+        self.assertEqual(self.matchmaker.join("1").pk, room.pk)
+
+    def test_waiting_player_is_not_paired_with_itself(self):
+        self.assertIsNone(self.matchmaker.join("1"))
+        self.assertIsNone(self.matchmaker.join("1"))
+        self.assertEqual(self.matchmaker.join("2").user1, "1")
+
+    def test_left_player_is_not_paired(self):
+        self.matchmaker.join("1")
+        self.matchmaker.leave("1")
+        self.assertIsNone(self.matchmaker.join("2"))
+
+    def test_waiting_rooms_are_claimed_first(self):
+        room = RoomGameModel.rooms.create_room("1")
+        self.assertEqual(self.matchmaker.join("2").pk, room.pk)
+        self.assertIsNone(self.matchmaker.join("3"))
+        self.assertFalse(self.matchmaker.has_waiting_rooms)
+
+    def test_detached_room_is_claimed(self):
+        self.matchmaker.join("1")
+        room = self.matchmaker.join("2")
+        with self.captureOnCommitCallbacks(execute=True):
+            RoomGameModel.rooms.detach_user("2")
+        self.assertTrue(self.matchmaker.has_waiting_rooms)
+        # 1 waits in its room until another player takes it
+        self.assertIsNone(self.matchmaker.join("1"))
+        claimed = self.matchmaker.join("3")
+        self.assertEqual(
+            (claimed.pk, claimed.user1, claimed.user2), (room.pk, "1", "3")
+        )
+        self.assertIsNone(self.matchmaker.join("4"))
+
+    def test_rooms_of_other_processes_are_rechecked(self):
+        now = [0]
+        matchmaker = Matchmaker(recheck=5, clock=lambda: now[0])
+        matchmaker.join("1")
+        matchmaker.leave("1")
+        self.assertFalse(matchmaker.has_waiting_rooms)
+        # written by another process, no commit callbacks run here
+        room = RoomGameModel.rooms.create(user1="2")
+        self.assertIsNone(matchmaker.join("3"))
+        matchmaker.leave("3")
+        now[0] = 10
+        self.assertEqual(matchmaker.join("4").pk, room.pk)
+
+    def test_paired_player_waits_for_its_room(self):
+        self.matchmaker.join("1")
+        self.matchmaker.queue.pair("2")
+        # the room of 1 and 2 is not written yet
+        self.assertIsNone(self.matchmaker.join("1"))
+        self.assertIsNone(self.matchmaker.join("3"))
+        self.assertIsNone(self.matchmaker.join("1"))
+
+    def test_cache_queue(self):
+        matchmaker = Matchmaker(CacheQueue(key="test-matchmaking"))
+        self.assertIsNone(matchmaker.join("1"))
+        self.assertEqual(
+            Matchmaker(CacheQueue(key="test-matchmaking")).join("2").user1, "1"
+        )
+
+
+class MatchmakerConcurrencyTest(RoomCacheMixin, TransactionTestCase):
+    users = 40
+
+    def play(self, matchmaker, barrier, user, errors):
+        try:
+            barrier.wait()
+            while matchmaker.join(user) is None:
+                time.sleep(0.001)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def test_every_player_gets_one_room(self):
+        matchmaker = Matchmaker()
+        barrier = threading.Barrier(self.users)
+        errors = []
+        threads = [
+            threading.Thread(
+                target=self.play, args=[matchmaker, barrier, str(user), errors]
+            )
+            for user in range(self.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(RoomGameModel.rooms.count(), self.users // 2)
+        for user in range(self.users):
+            self.assertEqual(RoomGameModel.rooms.user_rooms(str(user)).count(), 1)
+
+
+class RoomCacheTest(RoomCacheMixin, TransactionTestCase):
+    def test_room_lookups_make_no_queries(self):
+        RoomGameModel.rooms.create_room("1")
+        with self.assertNumQueries(0):
+            self.assertEqual(RoomGameModel.rooms.get_user_active_room("1").user1, "1")
+            self.assertTrue(RoomGameModel.rooms.is_user_have_active_room("1"))
+
+    def test_user_without_room_is_cached(self):
+        self.assertFalse(RoomGameModel.rooms.is_user_have_active_room("1"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(RoomGameModel.rooms.get_user_room("1"))
+        with self.assertRaises(RoomGameModel.DoesNotExist):
+            RoomGameModel.rooms.get_user_active_room("1")
+
+        RoomGameModel.rooms.create(user1="1", user2="2")
+        self.assertIsNotNone(RoomGameModel.rooms.get_user_room("1"))
+
+    def test_claim_invalidates_waiting_user(self):
+        RoomGameModel.rooms.create_room("1")
+        RoomGameModel.rooms.create_room("2")
+        self.assertEqual(RoomGameModel.rooms.get_user_active_room("1").user2, "2")
+        self.assertEqual(RoomGameModel.rooms.get_user_active_room("2").user1, "1")
+
+    def test_deactivated_room_is_invalidated(self):
+        room = RoomGameModel.rooms.create_room("1")
+        RoomGameModel.rooms.create_room("2")
+        room.refresh_from_db()
+        room.is_active = False
+        room.save()
+        self.assertIsNone(RoomGameModel.rooms.get_user_room("1"))
+        self.assertIsNone(RoomGameModel.rooms.get_user_room("2"))
+
+    def test_metrics(self):
+        RoomGameModel.rooms.get_user_room("1")
+        RoomGameModel.rooms.get_user_room("1")
+        self.assertEqual(
+            get_room_cache().metrics(), {"hits": 1, "misses": 1, "hit_rate": 0.5}
+        )
+
+    def test_invalidation_before_set_is_not_cached(self):
+        class RacingCache(LocalCache):
+            # the room of 1 changes right before its old room is cached
+            def set(self, key, value, timeout):
+                if key == "room:1":
+                    room_cache.invalidate("1")
+                super().set(key, value, timeout)
+
+        room_cache = RoomCache(RacingCache())
+        self.assertEqual(room_cache.get("1", lambda user: "old"), "old")
+        self.assertEqual(room_cache.get("1", lambda user: "new"), "new")
+        self.assertEqual(room_cache.metrics()["hits"], 0)
+
+    def test_invalidation_before_commit_is_not_cached(self):
+        room_cache = RoomCache(LocalCache())
+        with transaction.atomic():
+            room_cache.set("1", "old")
+            # another process commits a change of the room of 1
+            room_cache.cache.set("room:1:version", "changed", 300)
+        self.assertEqual(room_cache.get("1", lambda user: "new"), "new")
+
+    def test_own_invalidation_is_cached(self):
+        room_cache = RoomCache(LocalCache())
+        with transaction.atomic():
+            room_cache.invalidate("1")
+            room_cache.set("1", "new")
+        self.assertEqual(room_cache.get("1", lambda user: "loaded"), "new")
+
+    @override_settings(ROOM_CACHE_ALIAS="default")
+    def test_django_cache(self):
+        get_room_cache().clear()
+        RoomGameModel.rooms.create_room("1")
+        with self.assertNumQueries(0):
+            self.assertEqual(RoomGameModel.rooms.get_user_active_room("1").user1, "1")
+
+
+class LocalCacheTest(TestCase):
+    def test_least_recently_used_is_dropped(self):
+        cache = LocalCache(size=2)
+        cache.set("1", 1, 10)
+        cache.set("2", 2, 10)
+        cache.get("1")
+        cache.set("3", 3, 10)
+        self.assertEqual([cache.get(key) for key in "123"], [1, None, 3])
+
+    def test_entry_expires(self):
+        now = [0]
+        cache = LocalCache(clock=lambda: now[0])
+        cache.set("1", 1, 10)
+        now[0] = 10
+        self.assertIsNone(cache.get("1"))
+
+
+class RoomEventsTest(RoomCacheMixin, TransactionTestCase):
+    async def subscribed(self, room_id):
+        while room_id not in room_events.subscribers:
+            await asyncio.sleep(0.001)
+
+    async def test_wait_returns_when_partner_joins(self):
+        room = await sync_to_async(RoomGameModel.rooms.create_room)("1")
+        request = asyncio.ensure_future(
+            self.async_client.get(f"/rooms/{room.pk}/wait/")
+        )
+        await self.subscribed(room.pk)
+        await sync_to_async(RoomGameModel.rooms.create_room)("2")
+        response = await request
+        self.assertEqual(response.json()["user2"], "2")
+        self.assertNotIn(room.pk, room_events.subscribers)
+
+    async def test_wait_returns_full_room_at_once(self):
+        room = await sync_to_async(RoomGameModel.rooms.create)(user1="1", user2="2")
+        response = await self.async_client.get(f"/rooms/{room.pk}/wait/")
+        self.assertEqual(response.json()["user1"], "1")
+
+    @override_settings(ROOM_EVENTS_TIMEOUT=0.01)
+    async def test_wait_times_out(self):
+        room = await sync_to_async(RoomGameModel.rooms.create_room)("1")
+        response = await self.async_client.get(f"/rooms/{room.pk}/wait/")
+        self.assertEqual(response.status_code, 204)
+
+    async def test_unknown_room(self):
+        response = await self.async_client.get("/rooms/1/wait/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(room_events.subscribers, {})
+
+    async def test_room_is_streamed(self):
+        room = await sync_to_async(RoomGameModel.rooms.create_room)("1")
+        response = await self.async_client.get(f"/rooms/{room.pk}/events/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = aiter(response.streaming_content)
+
+        def read(chunk):
+            event, data = chunk.decode().splitlines()[:2]
+            self.assertEqual(event, "event: room")
+            return json.loads(data.removeprefix("data: "))
+
+        self.assertIsNone(read(await anext(events))["user2"])
+        await sync_to_async(RoomGameModel.rooms.create_room)("2")
+        self.assertEqual(read(await anext(events))["user2"], "2")
+        room.is_active = False
+        await sync_to_async(room.save)()
+        self.assertFalse(read(await anext(events))["is_active"])
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+app_name = "play"
+
+urlpatterns = [
+    path("rooms/<int:room_id>/wait/", views.wait_room, name="wait_room"),
+    path("rooms/<int:room_id>/events/", views.room_events_stream, name="room_events"),
+]
@@ -1,3 +1,73 @@
-from django.shortcuts import render
+import asyncio
+import json
 
-# Create your views here.
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+
+from .events import get_room_event, is_waiting, room_events
+from .models import RoomGameModel
+
+
+async def get_room(room_id):
+    room = await RoomGameModel.rooms.filter(pk=room_id).afirst()
+    if room is None:
+        raise Http404("No such room")
+    return room
+
+
+async def wait_room(request, room_id):
+    # long poll: answers at once when the room no longer waits for its
+    # second player, otherwise with the next change of the room, or with
+    # 204 after ROOM_EVENTS_TIMEOUT seconds; the room is read once, the
+    # change comes from the process that made it
+    subscriber = room_events.subscribe(room_id)
+    try:
+        # subscribed first, so a change right after the read is not missed
+        event = get_room_event(await get_room(room_id))
+        if is_waiting(event):
+            try:
+                event = await asyncio.wait_for(
+                    subscriber[1].get(),
+                    getattr(settings, "ROOM_EVENTS_TIMEOUT", 30),
+                )
+            except asyncio.TimeoutError:
+                return HttpResponse(status=204)
+        return JsonResponse(event)
+    finally:
+        room_events.unsubscribe(room_id, subscriber)
+
+
+async def stream_room(room_id, subscriber, event):
+    keepalive = getattr(settings, "ROOM_EVENTS_KEEPALIVE", 15)
+    try:
+        while True:
+            if event is None:
+                # a comment, so proxies do not close an idle connection
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: room\ndata: {json.dumps(event)}\n\n"
+                if not event["is_active"]:
+                    return
+            try:
+                event = await asyncio.wait_for(subscriber[1].get(), keepalive)
+            except asyncio.TimeoutError:
+                event = None
+    finally:
+        room_events.unsubscribe(room_id, subscriber)
+
+
+async def room_events_stream(request, room_id):
+    # server-sent events: the room as it is, then every change of it until
+    # the game is over
+    subscriber = room_events.subscribe(room_id)
+    try:
+        event = get_room_event(await get_room(room_id))
+    except Http404:
+        room_events.unsubscribe(room_id, subscriber)
+        raise
+    response = StreamingHttpResponse(
+        stream_room(room_id, subscriber, event), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
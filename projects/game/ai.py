@@ -0,0 +1,79 @@
+import numpy as np
+
+from .placement import get_placement_windows
+from .sea import Point
+
+
+class ComputerPlayer:
+    # fires at the cell covered by the most placements of the ships still
+    # afloat; it only knows what a player would: its shots and their results
+    def __init__(self, sea, rng=None):
+        self.sea = sea
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.selected = np.zeros((sea.row, sea.col), dtype=bool)
+        # hit cells of ships that are not sunk yet
+        self.hits = np.zeros((sea.row, sea.col), dtype=bool)
+
+    def get_density(self):
+        # an unsunk hit may still be part of a placement, other shots not
+        free = ~self.selected | self.hits
+        hunting = not self.hits.any()
+        # reaching[offset] sums the placements of the ships longer than
+        # offset, the cells offset away from their start are covered by them
+        lengths = [
+            length
+            for length in set(self.sea.list_lenght_ships)
+            if self.sea.get_count_ships_by_length(length) > 0
+        ]
+        reaching = np.zeros((max(lengths, default=0), 2) + free.shape, np.int64)
+
+        for length in lengths:
+            placements = get_placement_windows(free, length).astype(np.int64)
+            if not hunting:
+                # after a hit only placements through it count, more so
+                # when they go through several hits
+                placements *= self.count_covered_hits(length)
+
+            placements *= self.sea.get_count_ships_by_length(length)
+            reaching[:length] += placements
+
+        density = np.zeros(free.shape, dtype=np.int64)
+        for offset, placements in enumerate(reaching):
+            density[offset:, :] += placements[0, : self.sea.row - offset, :]
+            density[:, offset:] += placements[1, :, : self.sea.col - offset]
+
+        density[self.selected] = 0
+        return density
+
+    def count_covered_hits(self, length):
+        hits = self.hits.astype(np.int64)
+        covered = np.zeros((2,) + hits.shape, dtype=np.int64)
+        for offset in range(length):
+            covered[0, : self.sea.row - offset, :] += hits[offset:, :]
+            covered[1, :, : self.sea.col - offset] += hits[:, offset:]
+        return covered
+
+    def choose_cell(self):
+        density = self.get_density()
+        best = density.max()
+        if best > 0:
+            cells = np.flatnonzero(density == best)
+        else:
+            cells = np.flatnonzero(~self.selected)
+        return np.unravel_index(cells[self.rng.integers(len(cells))], density.shape)
+
+    def fire(self):
+        x, y = (int(index) for index in self.choose_cell())
+        return self.fire_at(x, y)
+
+    def fire_at(self, x, y):
+        changes = self.sea.get_changes_by_bomb_attack(Point(x, y))
+
+        self.selected[changes.x, changes.y] = True
+        if changes.x.stop - changes.x.start > 1 or changes.y.stop - changes.y.start > 1:
+            # only a sunk ship reveals more than the selected cell
+            self.hits[changes.x, changes.y] = False
+        elif self.sea.board.get_ship(x, y) is not None:
+            self.hits[x, y] = True
+
+        return x, y, changes
@@ -0,0 +1,94 @@
+import numpy as np
+
+from .placement import FleetPlacement
+from .sea import Point, Ship
+
+MISS = 0
+HIT = 1
+SUNK = 2
+REPEAT = 3
+
+
+class SeaBatch:
+    # count boards of the same size and fleet stored as single arrays, so a
+    # shot in every game is one set of numpy operations
+    def __init__(self, count, row, col, list_lenght_ships, layouts=None):
+        self.count = count
+        self.row = row
+        self.col = col
+        self.list_lenght_ships = list_lenght_ships
+        self.ship_ids = np.full((count, row, col), -1, dtype=np.int16)
+        self.selected = np.zeros((count, row, col), dtype=bool)
+        self.health = np.tile(np.array(list_lenght_ships), (count, 1))
+        # x.start, x.stop, y.start, y.stop of every ship area, like Ship.area
+        self.areas = np.zeros((count, len(list_lenght_ships), 4), dtype=np.int64)
+        self.remaining_cells = np.full(count, sum(list_lenght_ships))
+
+        if layouts is None:
+            layouts = [
+                FleetPlacement(row, col, list_lenght_ships).place()
+                for _ in range(count)
+            ]
+        for game, layout in enumerate(layouts):
+            ships = [
+                Ship(Point(x, y), length, direct) for x, y, length, direct in layout
+            ]
+            self.add_ships(game, ships)
+
+    @classmethod
+    def from_seas(cls, seas):
+        first = seas[0]
+        batch = cls(len(seas), first.row, first.col, first.list_lenght_ships, [])
+        for game, sea in enumerate(seas):
+            batch.add_ships(game, sea.ships)
+            batch.selected[game] = sea.board.get_selected_mask()
+            batch.remaining_cells[game] = sea.remaining_cells
+        return batch
+
+    def add_ships(self, game, ships):
+        for ship_id, ship in enumerate(ships):
+            self.ship_ids[game, ship.points.x, ship.points.y] = ship_id
+            self.health[game, ship_id] = ship.health
+            self.areas[game, ship_id] = (
+                ship.area.x.start,
+                ship.area.x.stop,
+                ship.area.y.start,
+                ship.area.y.stop,
+            )
+
+    def get_changes_by_bomb_attack(self, xs, ys):
+        # one shot per game; returns the result code of every game and the
+        # changed area as x.start, x.stop, y.start, y.stop rows
+        games = np.arange(self.count)
+        ship_ids = self.ship_ids[games, xs, ys]
+        repeat = self.selected[games, xs, ys]
+        hit = (ship_ids >= 0) & ~repeat
+        self.selected[games, xs, ys] = True
+
+        hit_games = games[hit]
+        hit_ships = ship_ids[hit]
+        self.health[hit_games, hit_ships] -= 1
+        self.remaining_cells[hit_games] -= 1
+
+        sunk = np.zeros(self.count, dtype=bool)
+        sunk[hit_games] = self.health[hit_games, hit_ships] == 0
+
+        changes = np.stack([xs, xs + 1, ys, ys + 1], axis=1)
+        changes[sunk] = self.areas[games[sunk], ship_ids[sunk]]
+        if sunk.any():
+            areas = changes[sunk]
+            rows = np.arange(self.row)
+            cols = np.arange(self.col)
+            in_rows = (rows >= areas[:, 0, None]) & (rows < areas[:, 1, None])
+            in_cols = (cols >= areas[:, 2, None]) & (cols < areas[:, 3, None])
+            self.selected[sunk] |= in_rows[:, :, None] & in_cols[:, None, :]
+
+        results = np.select([repeat, sunk, hit], [REPEAT, SUNK, HIT], MISS)
+        return results, changes
+
+    def get_count_ships_by_length(self, length):
+        lengths = np.array(self.list_lenght_ships)
+        return ((self.health > 0) & (lengths == length)).sum(axis=1)
+
+    def is_end_game(self):
+        return self.remaining_cells == 0
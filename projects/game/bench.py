@@ -0,0 +1,272 @@
+# run from the projects directory: python -m game.bench board
+import argparse
+import copy
+import json
+import pickle
+import time
+import tracemalloc
+
+import numpy as np
+
+from sea.logic import SeaBattle
+from sea.registry import GameRegistry
+
+from .ai import ComputerPlayer
+from .batch import SeaBatch
+from .placement import SPECS, FleetPlacement
+from .pool import FleetPool
+from .sea import BOARDS, Point, Sea
+
+ROW = 10
+COL = 10
+LIST_LENGHT_SHIPS = [4, 3, 3, 2, 2, 1, 1]
+# a move of the computer player on the classic board has to take well
+# under a millisecond, bench ai fails above this many seconds
+AI_MOVE_LIMIT = 0.5e-3
+
+
+def bench_board(args):
+    for engine in BOARDS:
+        tracemalloc.start()
+        start = time.perf_counter()
+        seas = [
+            Sea(args.row, args.col, LIST_LENGHT_SHIPS, engine=engine)
+            for _ in range(args.games)
+        ]
+        make_time = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        shots = 0
+        for sea in seas:
+            for x, y in np.ndindex(args.row, args.col):
+                sea.get_changes_by_bomb_attack(Point(x, y))
+                shots += 1
+        shot_time = time.perf_counter() - start
+
+        print(
+            f"{engine:>8}: {memory / args.games / 1024:8.1f} KiB/game, "
+            f"make {make_time / args.games * 1e6:8.1f} us/game, "
+            f"shot {shot_time / shots * 1e6:6.2f} us"
+        )
+
+
+def bench_placement(args):
+    for size in range(10, 101, 10):
+        # keep the classic fleet density on every board size
+        list_lenght_ships = LIST_LENGHT_SHIPS * (size // 10) ** 2
+        games = max(1, args.games // size)
+        start = time.perf_counter()
+        for _ in range(games):
+            FleetPlacement(size, size, list_lenght_ships).place()
+        spent = time.perf_counter() - start
+
+        print(
+            f"{size:>3}x{size:<3} {len(list_lenght_ships):>4} ships: "
+            f"{spent / games * 1e3:8.2f} ms/fleet"
+        )
+
+
+def bench_pool(args):
+    pool = FleetPool(args.row, args.col, LIST_LENGHT_SHIPS, size=args.games)
+    pool.start()
+    while not pool.layouts.full():
+        time.sleep(0.01)
+    pool.stop()
+
+    for name, get_layout in [("placement", lambda: None), ("pool", pool.pop)]:
+        start = time.perf_counter()
+        for _ in range(args.games):
+            Sea(args.row, args.col, LIST_LENGHT_SHIPS, layout=get_layout())
+        spent = time.perf_counter() - start
+        print(f"{name:>9}: {spent / args.games * 1e6:8.1f} us/game")
+
+
+def bench_delta(args):
+    battles = [SeaBattle(str(user_id)) for user_id in range(args.games)]
+    copies = copy.deepcopy(battles)
+    cells = list(np.ndindex(SeaBattle(None).table.coordinates.shape))
+
+    for name, battles, select_cell in [
+        ("json", battles, lambda battle, x, y: json.dumps(battle.select_cell(x, y))),
+        ("delta", copies, SeaBattle.select_cell_delta),
+    ]:
+        size = 0
+        start = time.perf_counter()
+        for battle in battles:
+            for x, y in cells:
+                size += len(select_cell(battle, x, y))
+        spent = time.perf_counter() - start
+
+        shots = len(battles) * len(cells)
+        print(
+            f"{name:>5}: {size / shots:6.1f} bytes/shot, "
+            f"{spent / shots * 1e6:6.2f} us/shot"
+        )
+
+
+def bench_batch(args):
+    seas = [Sea(args.row, args.col, LIST_LENGHT_SHIPS) for _ in range(args.games)]
+    batch = SeaBatch.from_seas(seas)
+    # every game fires at its cells in its own random order
+    order = np.argsort(np.random.random((args.games, args.row * args.col)), axis=1)
+    xs, ys = np.divmod(order, args.col)
+
+    start = time.perf_counter()
+    for step in range(order.shape[1]):
+        for game, sea in enumerate(seas):
+            sea.get_changes_by_bomb_attack(Point(xs[game, step], ys[game, step]))
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for step in range(order.shape[1]):
+        batch.get_changes_by_bomb_attack(xs[:, step], ys[:, step])
+    batch_time = time.perf_counter() - start
+
+    shots = order.size
+    print(f" loop: {loop_time / shots * 1e6:6.2f} us/shot")
+    print(f"batch: {batch_time / shots * 1e6:6.2f} us/shot")
+
+
+def bench_ai(args):
+    shots = 0
+    spent = 0
+    for _ in range(args.games):
+        sea = Sea(args.row, args.col, LIST_LENGHT_SHIPS)
+        player = ComputerPlayer(sea)
+        start = time.perf_counter()
+        while not sea.is_end_game():
+            player.fire()
+            shots += 1
+        spent += time.perf_counter() - start
+
+    print(
+        f"{shots / spent:8.0f} moves/sec, {spent / shots * 1e6:6.1f} us/move, "
+        f"{shots / args.games:5.1f} shots to win"
+    )
+    if (args.row, args.col) == (ROW, COL) and spent / shots > AI_MOVE_LIMIT:
+        raise SystemExit(
+            f"A move takes {spent / shots * 1e6:.1f} us, "
+            f"over the limit of {AI_MOVE_LIMIT * 1e6:.0f} us"
+        )
+
+
+def bench_replay(args):
+    games = []
+    for user_id in range(args.games):
+        battle = SeaBattle(str(user_id))
+        cells = np.random.permutation(battle.table.row * battle.table.col)
+        for x, y in zip(*np.divmod(cells, battle.table.col)):
+            battle.select_cell(x, y)
+        games.append((battle.table.seed, battle.table.moves))
+
+    start = time.perf_counter()
+    for user_id, (seed, moves) in enumerate(games):
+        battle = SeaBattle(str(user_id), seed=seed)
+        for x, y in zip(*np.divmod(moves, battle.table.col)):
+            battle.select_cell(x, y)
+    request_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for user_id, (seed, moves) in enumerate(games):
+        SeaBattle.replay(str(user_id), seed, moves)
+    replay_time = time.perf_counter() - start
+
+    print(f"select_cell: {request_time / args.games * 1e3:6.2f} ms/game")
+    print(f"     replay: {replay_time / args.games * 1e3:6.2f} ms/game")
+
+
+def bench_snapshot(args):
+    games = [
+        ("SeaBattle", [SeaBattle(str(user_id)) for user_id in range(args.games)]),
+    ]
+    for engine in BOARDS:
+        seas = [Sea(args.row, args.col, LIST_LENGHT_SHIPS, engine=engine)]
+        games.append((f"Sea {engine}", seas * args.games))
+
+    for name, objects in games:
+        for method, save, restore in [
+            ("pickle", pickle.dumps, pickle.loads),
+            ("bytes", lambda game: game.to_bytes(), get_restore(objects[0])),
+        ]:
+            start = time.perf_counter()
+            data = [save(game) for game in objects]
+            save_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for item in data:
+                restore(item)
+            restore_time = time.perf_counter() - start
+
+            print(
+                f"{name:>12} {method:>6}: {len(data[0]):5} bytes, "
+                f"save {save_time / len(data) * 1e6:7.1f} us, "
+                f"restore {restore_time / len(data) * 1e6:7.1f} us"
+            )
+
+
+def get_restore(game):
+    if isinstance(game, SeaBattle):
+        return lambda data: SeaBattle.from_bytes(None, data)
+    return Sea.from_bytes
+
+
+def bench_registry(args):
+    # a tenth of the games fit in memory, the rest wait as snapshots
+    tracemalloc.start()
+    registry = GameRegistry(max_games=max(16, args.games // 10))
+    for key in range(args.games):
+        registry.create(key, str(key))
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    moves = args.games * 10
+    keys = np.random.randint(args.games, size=moves)
+    cells = np.random.randint(min(args.row, args.col), size=(moves, 2))
+    start = time.perf_counter()
+    for key, (x, y) in zip(keys, cells):
+        registry.select_cell_delta(int(key), x, y)
+    spent = time.perf_counter() - start
+
+    print(f"{spent / moves * 1e6:6.1f} us/move, {memory / 1024 ** 2:6.1f} MiB")
+    print(registry.metrics())
+
+
+def bench_spec(args):
+    # a cold spec is worked out again for every game, as before specs
+    for name, clear in [("cold", SPECS.clear), ("shared", lambda: None)]:
+        start = time.perf_counter()
+        for _ in range(args.games):
+            clear()
+            Sea(args.row, args.col, LIST_LENGHT_SHIPS, engine="compact")
+        spent = time.perf_counter() - start
+        print(f"{name:>6}: {spent / args.games * 1e6:8.1f} us/game")
+
+
+BENCHMARKS = {
+    "board": bench_board,
+    "placement": bench_placement,
+    "pool": bench_pool,
+    "delta": bench_delta,
+    "batch": bench_batch,
+    "ai": bench_ai,
+    "replay": bench_replay,
+    "snapshot": bench_snapshot,
+    "registry": bench_registry,
+    "spec": bench_spec,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("name", choices=BENCHMARKS)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--row", type=int, default=ROW)
+    parser.add_argument("--col", type=int, default=COL)
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    main()
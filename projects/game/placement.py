@@ -0,0 +1,282 @@
+import numpy as np
+
+# a ship is placed by its top/left cell, so "up" and "left" would only
+# repeat the placements of "down" and "right" from another start point
+DIRECTS = ["down", "right"]
+# the step from one cell of a ship to the next, of every direct
+DIRECT_STEPS = {"down": (1, 0), "up": (-1, 0), "right": (0, 1), "left": (0, -1)}
+
+
+def get_placement_windows(free, length):
+    # placements[direct, x, y] is True when a ship of this length starting
+    # at (x, y) in that direct covers only free cells: the and of the free
+    # cells shifted by every cell of the ship
+    row, col = free.shape
+    placements = np.zeros((len(DIRECTS), row, col), dtype=bool)
+    if length <= row:
+        down = placements[0, : row - length + 1, :]
+        down[...] = free[: row - length + 1, :]
+        for offset in range(1, length):
+            down &= free[offset : row - length + 1 + offset, :]
+    if 1 < length <= col:
+        right = placements[1, :, : col - length + 1]
+        right[...] = free[:, : col - length + 1]
+        for offset in range(1, length):
+            right &= free[:, offset : col - length + 1 + offset]
+    return placements
+
+
+# every spec made so far, by (row, col, fleet)
+SPECS = {}
+
+
+class BoardSpec:
+    # what only depends on the board size and the fleet is worked out once
+    # and shared by all games of that spec, so its arrays are never changed
+    def __init__(self, row, col, list_lenght_ships):
+        self.row = row
+        self.col = col
+        self.list_lenght_ships = list(list_lenght_ships)
+        # destination and source slices moving the board by each of the 8
+        # neighbour offsets, so dilate is a few in place ors
+        self.neighbour_offsets = []
+        for dx in [-1, 0, 1]:
+            for dy in [-1, 0, 1]:
+                if dx or dy:
+                    self.neighbour_offsets.append(
+                        (
+                            (self.shift(dx, row), self.shift(dy, col)),
+                            (self.shift(-dx, row), self.shift(-dy, col)),
+                        )
+                    )
+        # placements of every length on the empty board
+        empty = np.ones((row, col), dtype=bool)
+        self.placements = {
+            length: get_placement_windows(empty, length)
+            for length in set(list_lenght_ships)
+        }
+        # area -> the candidates of each length a ship in that area rules
+        # out, filled on first use
+        self.removals = {}
+
+    @classmethod
+    def get(cls, row, col, list_lenght_ships):
+        key = (row, col, tuple(list_lenght_ships))
+        spec = SPECS.get(key)
+        if spec is None:
+            spec = SPECS.setdefault(key, cls(row, col, list_lenght_ships))
+        return spec
+
+    def __reduce__(self):
+        # a game pickles or copies with a reference to the shared spec of
+        # this process, not with its arrays and removals cache
+        return BoardSpec.get, (self.row, self.col, self.list_lenght_ships)
+
+    def check_layout(self, layout):
+        # a layout made for another spec would lose the cells outside the
+        # board and leave a game that can not end
+        lengths = sorted(length for _, _, length, _ in layout)
+        if lengths != sorted(self.list_lenght_ships):
+            raise ValueError(
+                f"Layout ships {lengths} do not match the fleet "
+                f"{self.list_lenght_ships}"
+            )
+        for x, y, length, direct in layout:
+            if direct not in DIRECT_STEPS:
+                raise ValueError(f"Unknown direct {direct}")
+            dx, dy = DIRECT_STEPS[direct]
+            xs = sorted([x, x + dx * (length - 1)])
+            ys = sorted([y, y + dy * (length - 1)])
+            if xs[0] < 0 or ys[0] < 0 or xs[1] >= self.row or ys[1] >= self.col:
+                raise ValueError(
+                    f"Ship {(x, y, length, direct)} is outside the "
+                    f"{self.row}x{self.col} board"
+                )
+
+    def shift(self, offset, size):
+        return slice(max(0, offset), size + min(0, offset))
+
+    def dilate(self, mask):
+        dilated = mask.copy()
+        for destination, source in self.neighbour_offsets:
+            dilated[destination] |= mask[source]
+        return dilated
+
+    def get_placements(self, length):
+        if length not in self.placements:
+            return get_placement_windows(np.ones((self.row, self.col), bool), length)
+        return self.placements[length].copy()
+
+    def get_valid_placements(self, occupied, length):
+        # a ship may not touch another one, so its cells must stay out of
+        # the dilated ship cells
+        if not occupied.any():
+            return self.get_placements(length)
+        return get_placement_windows(~self.dilate(occupied), length)
+
+    def get_area(self, x, y, length, direct):
+        if direct == "down":
+            x_stop, y_stop = x + length, y + 1
+        else:
+            x_stop, y_stop = x + 1, y + length
+
+        return max(0, x - 1), x_stop + 1, max(0, y - 1), y_stop + 1
+
+    def get_removals(self, area):
+        removals = self.removals.get(area)
+        if removals is not None:
+            return removals
+
+        x_start, x_stop, y_start, y_stop = area
+        removals = []
+        for length in self.placements:
+            down = (
+                0,
+                slice(max(0, x_start - length + 1), x_stop),
+                slice(y_start, y_stop),
+            )
+            right = (
+                1,
+                slice(x_start, x_stop),
+                slice(max(0, y_start - length + 1), y_stop),
+            )
+            removals.append((length, down, right))
+        self.removals[area] = removals
+        return removals
+
+
+class FleetPlacement:
+    def __init__(
+        self,
+        row,
+        col,
+        list_lenght_ships,
+        rng=None,
+        occupied=None,
+        spec=None,
+        max_attempts=None,
+        max_restarts=10,
+    ):
+        self.row = row
+        self.col = col
+        self.list_lenght_ships = list_lenght_ships
+        if spec is None:
+            spec = BoardSpec.get(row, col, list_lenght_ships)
+        self.spec = spec
+        self.rng = rng if rng is not None else np.random.default_rng()
+        if occupied is None:
+            occupied = np.zeros((row, col), dtype=bool)
+        self.occupied = occupied
+        # a search that runs into a bad start can take forever, so it is
+        # given up after max_attempts options and started again with fresh
+        # draws; the search after max_restarts runs to the end
+        if max_attempts is None:
+            max_attempts = 10 * len(list_lenght_ships) + 1000
+        self.max_attempts = max_attempts
+        self.max_restarts = max_restarts
+
+    def get_candidates(self, length):
+        return self.spec.get_valid_placements(self.occupied, length)
+
+    def get_area(self, x, y, length, direct):
+        return self.spec.get_area(x, y, length, direct)
+
+    def remove_candidates(self, candidates, area):
+        # returns what was removed so a failed branch can put it back
+        removed = []
+        for length, down, right in self.spec.get_removals(area):
+            mask = candidates[length]
+            for index in [down, right]:
+                removed.append((mask, index, mask[index].copy()))
+                mask[index] = False
+        return removed
+
+    def restore_candidates(self, removed):
+        for mask, index, values in reversed(removed):
+            mask[index] = values
+
+    def place(self):
+        # bigger ships are the hardest to fit, so they go first
+        order = sorted(
+            range(len(self.list_lenght_ships)),
+            key=lambda index: self.list_lenght_ships[index],
+            reverse=True,
+        )
+        lengths = [self.list_lenght_ships[index] for index in order]
+        if not self.is_area_possible(lengths):
+            raise Exception(f"Not Make Fleet {self.list_lenght_ships}")
+
+        for restart in range(self.max_restarts + 1):
+            candidates = {
+                length: self.get_candidates(length) for length in set(lengths)
+            }
+            max_attempts = self.max_attempts if restart < self.max_restarts else None
+            placements = self.place_ships(order, lengths, candidates, max_attempts)
+            if placements is not None:
+                return placements
+
+    def is_area_possible(self, lengths):
+        # a ship with the cells right and below it is a (length + 1) x 2
+        # block, the blocks never overlap and all fit on the board grown by
+        # one row and one column
+        return sum((length + 1) * 2 for length in lengths) <= (self.row + 1) * (
+            self.col + 1
+        )
+
+    def is_fleet_possible(self, lengths, candidates):
+        # lengths are sorted, so each length only has to be checked once
+        for length in set(lengths):
+            if not candidates[length].any():
+                return False
+        return True
+
+    def place_ships(self, order, lengths, candidates, max_attempts=None):
+        # depth first search with a stack of the placed ships; returns None
+        # when max_attempts options were tried, raises when every option
+        # was tried and the fleet does not fit
+        placements = [None] * len(order)
+        # option, removed candidates and closed options of every placed ship
+        stack = []
+        # a ship of one length is interchangeable with the others, so an
+        # option that failed is closed for all of them until we go back up
+        closed = []
+        attempts = 0
+        index = 0
+        while index < len(order):
+            length = lengths[index]
+            mask = candidates[length]
+            options = np.flatnonzero(mask)
+            if len(options) == 0:
+                # a dead end, the ship before takes its next option
+                mask.flat[closed] = True
+                if not stack:
+                    raise Exception(f"Not Make Fleet {self.list_lenght_ships}")
+                option, removed, closed = stack.pop()
+                index -= 1
+                self.restore_candidates(removed)
+                candidates[lengths[index]].flat[option] = False
+                closed.append(option)
+                continue
+
+            attempts += 1
+            if max_attempts is not None and attempts > max_attempts:
+                return None
+
+            option = options[self.rng.integers(len(options))]
+            direct, x, y = np.unravel_index(option, mask.shape)
+            x, y, direct = int(x), int(y), DIRECTS[direct]
+
+            removed = self.remove_candidates(
+                candidates, self.get_area(x, y, length, direct)
+            )
+            placements[order[index]] = (x, y, length, direct)
+
+            if self.is_fleet_possible(lengths[index + 1 :], candidates):
+                stack.append((option, removed, closed))
+                closed = []
+                index += 1
+            else:
+                self.restore_candidates(removed)
+                mask.flat[option] = False
+                closed.append(option)
+        return placements
@@ -0,0 +1,114 @@
+# generate layouts offline from the projects directory:
+#     python -m game.pool layouts.npy --count 10000
+import argparse
+import queue
+import threading
+
+import numpy as np
+
+from .placement import DIRECTS, BoardSpec, FleetPlacement
+
+# a layout is one row per ship: x, y, length, direct index in DIRECTS
+LAYOUT_DTYPE = np.uint16
+
+
+def encode_layouts(layouts):
+    return np.array(
+        [
+            [(x, y, length, DIRECTS.index(direct)) for x, y, length, direct in layout]
+            for layout in layouts
+        ],
+        dtype=LAYOUT_DTYPE,
+    )
+
+
+def decode_layout(ships):
+    return [
+        (int(x), int(y), int(length), DIRECTS[direct]) for x, y, length, direct in ships
+    ]
+
+
+def save_layouts(path, layouts):
+    np.save(path, encode_layouts(layouts))
+
+
+def load_layouts(path):
+    return [decode_layout(ships) for ships in np.load(path)]
+
+
+class FleetPool:
+    def __init__(self, row, col, list_lenght_ships, size=100, seed=None):
+        self.row = row
+        self.col = col
+        self.list_lenght_ships = list_lenght_ships
+        # the games taking layouts from the pool are made with this spec
+        self.spec = BoardSpec.get(row, col, list_lenght_ships)
+        # a generator is not thread safe, the worker gets its own child seed
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.layouts = queue.Queue(maxsize=size)
+        self.stopped = threading.Event()
+        self.worker = None
+
+    def make_layout(self, rng=None):
+        placement = FleetPlacement(
+            self.row, self.col, self.list_lenght_ships, rng, spec=self.spec
+        )
+        return placement.place()
+
+    def fill(self, rng):
+        while not self.stopped.is_set():
+            layout = self.make_layout(rng)
+            while not self.stopped.is_set():
+                try:
+                    self.layouts.put(layout, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def start(self):
+        self.stopped.clear()
+        rng = np.random.default_rng(self.seed_sequence.spawn(1)[0])
+        self.worker = threading.Thread(target=self.fill, args=[rng], daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+
+    def extend(self, layouts):
+        for layout in layouts:
+            try:
+                self.layouts.put_nowait(layout)
+            except queue.Full:
+                break
+
+    def load(self, path):
+        self.extend(load_layouts(path))
+
+    def pop(self):
+        # an empty pool never blocks a new game, it just pays for placement
+        try:
+            return self.layouts.get_nowait()
+        except queue.Empty:
+            return self.make_layout()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--row", type=int, default=10)
+    parser.add_argument("--col", type=int, default=10)
+    parser.add_argument("--ships", type=int, nargs="+", default=[4, 3, 3, 2, 2, 1, 1])
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    pool = FleetPool(args.row, args.col, args.ships)
+    rng = np.random.default_rng(args.seed)
+    save_layouts(args.path, [pool.make_layout(rng) for _ in range(args.count)])
+
+
+if __name__ == "__main__":
+    main()
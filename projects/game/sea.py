@@ -1,7 +1,19 @@
-import random
+from array import array
 from enum import Enum
+from functools import cached_property
 import numpy as np
 
+from .placement import BoardSpec, FleetPlacement
+from .snapshot import (
+    Snapshot,
+    get_move_typecode,
+    get_ship_id_dtype,
+    get_ship_ids,
+    write_snapshot,
+)
+
+SNAPSHOT_MAGIC = b"SEAG"
+
 
 class Cell:
     def __init__(self, ship=None):
@@ -60,9 +72,10 @@ class Ship:
             )
 
     def get_area_points(self):
+        x, y = self.points.x, self.points.y
         return Point(
-            slice(max(0, self.points.x.start - 1), max(0, self.points.x.stop + 1)),
-            slice(max(0, self.points.y.start - 1), max(0, self.points.y.stop + 1)),
+            slice(max(0, x.start - 1), x.stop + 1),
+            slice(max(0, y.start - 1), y.stop + 1),
         )
 
     def is_inside(self, x, y):
@@ -77,102 +90,336 @@ class Ship:
             self.health -= 1
 
 
+class ObjectBoard:
+    def __init__(self, row, col, count_ships):
+        self.coordinates = np.empty((row, col), dtype=object)
+        self.coordinates.flat = [Cell() for _ in range(row * col)]
+
+    def get_ship(self, x, y):
+        return self.coordinates[x, y].ship
+
+    def is_selected(self, x, y):
+        return self.coordinates[x, y].is_selected
+
+    def mark_ship(self, points, ship):
+        for cell in self.coordinates[points.x, points.y].flatten():
+            cell.ship = ship
+
+    def mark_selected(self, points):
+        for cell in self.coordinates[points.x, points.y].flatten():
+            cell.is_selected = True
+
+    def is_area_empty(self, area):
+        for cell in self.coordinates[area.x, area.y].flatten():
+            if cell.is_ship():
+                return False
+        return True
+
+    def get_ship_mask(self):
+        return np.vectorize(Cell.is_ship, otypes=[bool])(self.coordinates)
+
+    def get_selected_mask(self):
+        selected = [cell.is_selected for cell in self.coordinates.flat]
+        return np.array(selected).reshape(self.coordinates.shape)
+
+    def set_selected_mask(self, mask):
+        for cell in self.coordinates[mask]:
+            cell.is_selected = True
+
+    def get_ship_ids(self, ships):
+        return get_ship_ids(*self.coordinates.shape, ships)
+
+    def set_ships(self, ships, ship_ids):
+        for ship in ships:
+            self.mark_ship(ship.points, ship)
+
+    def get_selected_bits(self):
+        mask = self.get_selected_mask().ravel()
+        return np.packbits(mask, bitorder="little").tobytes()
+
+    def set_selected_bits(self, data):
+        bits = np.unpackbits(np.frombuffer(data, np.uint8), bitorder="little")
+        cells = self.coordinates.ravel()
+        for index in np.flatnonzero(bits[: cells.size]).tolist():
+            cells[index].is_selected = True
+
+
+class CompactBoard:
+    # ship ids live in an int8 plane (-1 means no ship) and the selected
+    # cells in a python int used as a bitboard, bit x * col + y per cell
+    def __init__(self, row, col, count_ships):
+        self.row = row
+        self.col = col
+        self.ship_ids = np.full((row, col), -1, dtype=get_ship_id_dtype(count_ships))
+        self.selected = 0
+        self.ships = []
+
+    @property
+    def coordinates(self):
+        # the cells as ObjectBoard keeps them, built on every call; changing
+        # them does not change the board
+        coordinates = np.empty((self.row, self.col), dtype=object)
+        selected = self.get_selected_mask()
+        for x, y in np.ndindex(coordinates.shape):
+            coordinates[x, y] = Cell(self.get_ship(x, y))
+            coordinates[x, y].is_selected = bool(selected[x, y])
+        return coordinates
+
+    def get_ship(self, x, y):
+        ship_id = self.ship_ids[x, y]
+        if ship_id < 0:
+            return None
+        return self.ships[ship_id]
+
+    def is_selected(self, x, y):
+        return bool(self.selected >> int(x * self.col + y) & 1)
+
+    def mark_ship(self, points, ship):
+        self.ship_ids[points.x, points.y] = len(self.ships)
+        self.ships.append(ship)
+
+    def mark_selected(self, points):
+        x_start, x_stop, _ = points.x.indices(self.row)
+        y_start, y_stop, _ = points.y.indices(self.col)
+        if y_stop <= y_start:
+            return
+
+        row_bits = (1 << (y_stop - y_start)) - 1
+        for x in range(x_start, x_stop):
+            self.selected |= row_bits << (x * self.col + y_start)
+
+    def is_area_empty(self, area):
+        return not (self.ship_ids[area.x, area.y] >= 0).any()
+
+    def get_ship_mask(self):
+        return self.ship_ids >= 0
+
+    def get_selected_mask(self):
+        size = self.row * self.col
+        data = np.frombuffer(self.selected.to_bytes(-(-size // 8), "little"), np.uint8)
+        bits = np.unpackbits(data, bitorder="little")[:size]
+        return bits.reshape(self.row, self.col).astype(bool)
+
+    def set_selected_mask(self, mask):
+        data = np.packbits(mask.ravel(), bitorder="little").tobytes()
+        self.selected |= int.from_bytes(data, "little")
+
+    def get_ship_ids(self, ships):
+        return self.ship_ids
+
+    def set_ships(self, ships, ship_ids):
+        self.ships = list(ships)
+        self.ship_ids = ship_ids.copy()
+
+    def get_selected_bits(self):
+        # bit x * col + y of the bitboard is bit y of byte x * col // 8
+        return self.selected.to_bytes(-(-self.row * self.col // 8), "little")
+
+    def set_selected_bits(self, data):
+        self.selected |= int.from_bytes(data, "little")
+
+
+BOARDS = {
+    "object": ObjectBoard,
+    "compact": CompactBoard,
+}
+
+
 class Sea:
-    def __init__(self, row, col, list_lenght_ships):
+    def __init__(
+        self, row, col, list_lenght_ships, engine="object", layout=None, seed=None
+    ):
+        if engine not in BOARDS:
+            raise ValueError(f"Unknown board engine {engine}")
+
         self.row = row
         self.col = col
         self.list_lenght_ships = list_lenght_ships
+        self.spec = BoardSpec.get(row, col, list_lenght_ships)
+        self.engine = engine
+        # every game draws from its own generator, so its seed and the
+        # move log are enough to rebuild it
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.moves = array(get_move_typecode(row, col))
         self.make_coordinates()
-        self.make_ships()
+        self.make_ships(layout)
+
+    @cached_property
+    def rng(self):
+        # only drawn from to place the fleet, a restored sea never makes one
+        return np.random.default_rng(self.seed)
+
+    @classmethod
+    def replay(cls, row, col, list_lenght_ships, seed, moves, engine="object"):
+        sea = cls(row, col, list_lenght_ships, engine=engine, seed=seed)
+        sea.apply_moves(moves)
+        return sea
+
+    @classmethod
+    def from_bytes(cls, data, engine=None):
+        # the state is set straight from the blocks of the snapshot, without
+        # __init__: the layout was checked when the sea was made
+        snapshot = Snapshot(data, SNAPSHOT_MAGIC)
+        if engine is None:
+            engine = list(BOARDS)[snapshot.engine]
+        elif engine not in BOARDS:
+            raise ValueError(f"Unknown board engine {engine}")
+
+        layout = snapshot.get_layout()
+        sea = cls.__new__(cls)
+        sea.row = snapshot.row
+        sea.col = snapshot.col
+        sea.list_lenght_ships = [length for _, _, length, _ in layout]
+        sea.spec = BoardSpec.get(sea.row, sea.col, sea.list_lenght_ships)
+        sea.engine = engine
+        sea.seed = snapshot.seed
+        sea.moves = array(get_move_typecode(sea.row, sea.col))
+        sea.moves.frombytes(snapshot.moves.tobytes())
+        sea.make_coordinates()
+
+        sea.ships = []
+        for (x, y, length, direct), health in zip(
+            layout, snapshot.get_health().tolist()
+        ):
+            ship = Ship(Point(x, y), length, direct)
+            ship.health = health
+            sea.ships.append(ship)
+        sea.board.set_ships(sea.ships, snapshot.ship_ids)
+        sea.count_fleet()
+        sea.board.set_selected_bits(snapshot.cells)
+        return sea
+
+    def to_bytes(self):
+        return write_snapshot(
+            SNAPSHOT_MAGIC,
+            list(BOARDS).index(self.engine),
+            self.row,
+            self.col,
+            self.seed,
+            self.ships,
+            self.moves,
+            self.board.get_ship_ids(self.ships),
+            self.board.get_selected_bits(),
+        )
 
-    def make_coordinates(self):
-        self.coordinates = np.empty((self.row, self.col), dtype=object)
-        for y, x in np.ndindex(self.coordinates.shape):
-            self.coordinates[x, y] = Cell()
+    @property
+    def coordinates(self):
+        return self.board.coordinates
 
-    def make_ships(self):
-        self.ships = []
-        for length in self.list_lenght_ships:
-            self.ships.append(self.make_ship(length))
+    def make_coordinates(self):
+        board_class = BOARDS[self.engine]
+        self.board = board_class(self.row, self.col, len(self.list_lenght_ships))
 
-    def get_posible_points(self):
-        posible_points = []
-        for y, x in np.ndindex(self.coordinates.shape):
-            if not self.coordinates[x, y].is_ship():
-                posible_points.append(Point(x, y))
+    def make_ships(self, layout=None):
+        if layout is None:
+            placement = FleetPlacement(
+                self.row, self.col, self.list_lenght_ships, self.rng, spec=self.spec
+            )
+            layout = placement.place()
+        else:
+            self.spec.check_layout(layout)
 
-        return posible_points
+        self.ships = []
+        for x, y, length, direct in layout:
+            ship = Ship(Point(x, y), length, direct)
+            self.mark_cell_as_ship(ship.points, ship)
+            self.ships.append(ship)
+        self.count_fleet()
+
+    def count_fleet(self):
+        # kept up to date on every hit so status queries never walk the ships
+        self.remaining_cells = 0
+        self.alive_ships = {}
+        for ship in self.ships:
+            self.remaining_cells += ship.health
+            self.alive_ships.setdefault(ship.length, 0)
+            if ship.is_alive():
+                self.alive_ships[ship.length] += 1
 
     def mark_cell_as_ship(self, points, ship):
-        for cell in self.coordinates[points.x, points.y].flatten():
-            cell.ship = ship
+        self.board.mark_ship(points, ship)
 
     def mark_cell_as_selected(self, points):
-        for cell in self.coordinates[points.x, points.y].flatten():
-            cell.is_selected = True
-
-    def make_ship(self, length):
-        posible_points = self.get_posible_points()
-        random.shuffle(posible_points)
-        for point in posible_points:
-            directs = np.array([direct.value for direct in Direct])
-            random.shuffle(directs)
-            for direct in directs:
-                ship = self.get_random_ship(point, length, direct)
-                if ship is not None:
-                    self.mark_cell_as_ship(ship.points, ship)
-                    return ship
-
-        raise Exception(f"Not Make Ship by length {length}")
+        self.board.mark_selected(points)
 
     def is_points_valid(self, points):
         if points.x.start < 0 or points.y.start < 0:
             return False
 
-        if points.x.stop > self.row - 1 or points.y.stop > self.col - 1:
+        if points.x.stop > self.row or points.y.stop > self.col:
             return False
 
         return True
 
     def is_area_ship_valid(self, area):
-        for cell in self.coordinates[area.x, area.y].flatten():
-            if cell.is_ship():
-                return False
-        return True
-
-    def get_random_ship(self, point, length, direct):
-        ship = Ship(point, length, direct)
+        return self.board.is_area_empty(area)
 
-        if self.is_points_valid(ship.points) and self.is_area_ship_valid(ship.area):
-            return ship
-        return None
+    def get_valid_placements(self, length):
+        return self.spec.get_valid_placements(self.board.get_ship_mask(), length)
 
     def target_ship(self, point):
-        cell = self.coordinates[point.x, point.y]
-        ship = cell.ship
+        ship = self.board.get_ship(point.x, point.y)
 
         ship.damage()
+        self.remaining_cells -= 1
         if not ship.is_alive():
+            self.alive_ships[ship.length] -= 1
             self.mark_cell_as_selected(ship.area)
             return ship.area
         else:
-            cell.is_selected = True
-            return Point(slice(point.x, point.x + 1), slice(point.y, point.y + 1))
+            point = Point(slice(point.x, point.x + 1), slice(point.y, point.y + 1))
+            self.mark_cell_as_selected(point)
+            return point
 
     def get_changes_by_bomb_attack(self, point):
-        selected_cell = self.coordinates[point.x, point.y]
+        self.moves.append(point.x * self.col + point.y)
+        if self.board.is_selected(point.x, point.y):
+            return Point(slice(point.x, point.x + 1), slice(point.y, point.y + 1))
 
-        if selected_cell.is_ship():
+        if self.board.get_ship(point.x, point.y) is not None:
             return self.target_ship(point)
 
         else:
-            selected_cell.is_selected = True
-            return Point(slice(point.x, point.x + 1), slice(point.y, point.y + 1))
+            point = Point(slice(point.x, point.x + 1), slice(point.y, point.y + 1))
+            self.mark_cell_as_selected(point)
+            return point
+
+    def apply_moves(self, moves):
+        # the state after a set of shots does not depend on their order, so
+        # it is worked out with array operations instead of shot by shot
+        self.moves.extend(moves)
+        selected = self.board.get_selected_mask()
+        shots = np.zeros(self.row * self.col, dtype=bool)
+        shots[np.asarray(moves, dtype=np.int64)] = True
+        shots = shots.reshape(self.row, self.col) & ~selected
+
+        ship_ids = np.full((self.row, self.col), -1)
+        for ship_id, ship in enumerate(self.ships):
+            ship_ids[ship.points.x, ship.points.y] = ship_id
+        hits = np.bincount(ship_ids[shots & (ship_ids >= 0)], minlength=len(self.ships))
+
+        selected |= shots
+        for ship, count in zip(self.ships, hits):
+            if count == 0:
+                continue
+
+            ship.health -= int(count)
+            self.remaining_cells -= int(count)
+            if not ship.is_alive():
+                self.alive_ships[ship.length] -= 1
+                selected[ship.area.x, ship.area.y] = True
+
+        self.board.set_selected_mask(selected)
 
     def get_count_ships_by_length(self, length):
-        count = 0
-        for ship in self.ships:
-            if ship.is_alive() and ship.length == length:
-                count += 1
+        return self.alive_ships.get(length, 0)
+
+    def is_end_game(self):
+        return self.remaining_cells == 0
 
-        return count
+    def fleet_status(self):
+        return {
+            "remaining_cells": self.remaining_cells,
+            "alive_ships": dict(self.alive_ships),
+            "is_end_game": self.is_end_game(),
+        }
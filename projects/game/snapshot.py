@@ -0,0 +1,103 @@
+import struct
+
+import numpy as np
+
+from .placement import DIRECTS
+
+# a snapshot is the header followed by fixed width blocks:
+#     ship ids    row * col ints, -1 where there is no ship
+#     fleet       one uint16 row per ship: x, y, length, direct, health
+#     moves       the move log
+#     cells       whatever else the engine keeps per cell, up to the end
+SNAPSHOT_VERSION = 3
+HEADER = struct.Struct("<4sBBHHHI16s")
+FLEET_DTYPE = np.uint16
+
+
+def get_ship_id_dtype(count_ships):
+    return np.int8 if count_ships <= np.iinfo(np.int8).max else np.int16
+
+
+def get_move_typecode(row, col):
+    return "H" if row * col <= 1 << 16 else "I"
+
+
+def get_ship_layout(ship):
+    direct = "right" if ship.points.y.stop - ship.points.y.start > 1 else "down"
+    return ship.points.x.start, ship.points.y.start, ship.length, direct
+
+
+def get_ship_ids(row, col, ships):
+    ship_ids = np.full((row, col), -1, dtype=get_ship_id_dtype(len(ships)))
+    for ship_id, ship in enumerate(ships):
+        ship_ids[ship.points.x, ship.points.y] = ship_id
+    return ship_ids
+
+
+def write_snapshot(magic, engine, row, col, seed, ships, moves, ship_ids, cells):
+    ship_ids = ship_ids.astype(get_ship_id_dtype(len(ships)), copy=False)
+    fleet = []
+    for ship in ships:
+        x, y, length, direct = get_ship_layout(ship)
+        fleet += [x, y, length, DIRECTS.index(direct), ship.health]
+    fleet = np.array(fleet, dtype=FLEET_DTYPE)
+
+    header = HEADER.pack(
+        magic,
+        SNAPSHOT_VERSION,
+        engine,
+        row,
+        col,
+        len(ships),
+        len(moves),
+        seed.to_bytes(16, "little"),
+    )
+    return b"".join(
+        [header, ship_ids.tobytes(), fleet.tobytes(), moves.tobytes(), cells]
+    )
+
+
+class Snapshot:
+    # the blocks are numpy views on data, nothing is copied
+    def __init__(self, data, magic):
+        (
+            data_magic,
+            version,
+            self.engine,
+            self.row,
+            self.col,
+            count_ships,
+            count_moves,
+            seed,
+        ) = HEADER.unpack_from(data)
+        if data_magic != magic:
+            raise ValueError(f"Not a {magic.decode()} snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unknown snapshot version {version}")
+
+        self.seed = int.from_bytes(seed, "little")
+        offset = HEADER.size
+
+        dtype = get_ship_id_dtype(count_ships)
+        self.ship_ids = np.frombuffer(data, dtype, self.row * self.col, offset)
+        self.ship_ids = self.ship_ids.reshape(self.row, self.col)
+        offset += self.ship_ids.nbytes
+
+        self.fleet = np.frombuffer(data, FLEET_DTYPE, count_ships * 5, offset)
+        self.fleet = self.fleet.reshape(count_ships, 5)
+        offset += self.fleet.nbytes
+
+        typecode = get_move_typecode(self.row, self.col)
+        self.moves = np.frombuffer(data, typecode, count_moves, offset)
+        offset += self.moves.nbytes
+
+        self.cells = memoryview(data)[offset:]
+
+    def get_layout(self):
+        return [
+            (x, y, length, DIRECTS[direct])
+            for x, y, length, direct, _ in self.fleet.tolist()
+        ]
+
+    def get_health(self):
+        return self.fleet[:, 4]
@@ -0,0 +1,583 @@
+# run from the projects directory: python -m unittest game.tests
+import asyncio
+import copy
+import pickle
+import time
+import unittest
+
+import numpy as np
+
+from sea.logic import (
+    CELLS,
+    SMALL_CELLS,
+    SeaBattle,
+    Cell,
+    Table,
+    apply_delta,
+    decode_board,
+    decode_cells,
+    decode_delta,
+    decode_delta_cells,
+    encode_cells,
+    encode_cells_array,
+)
+from sea.registry import GameRegistry
+from sea.server import GameServer, Move
+
+from .ai import ComputerPlayer
+from .batch import HIT, MISS, REPEAT, SUNK, SeaBatch
+from .placement import BoardSpec, FleetPlacement
+from .pool import FleetPool
+from .sea import BOARDS, Point, Sea
+
+CLASSIC = (10, 10, [4, 3, 3, 2, 2, 1, 1])
+
+
+class EngineTest(unittest.TestCase):
+    def test_engines_have_the_same_coordinates(self):
+        seas = [Sea(*CLASSIC, engine=engine, seed=1) for engine in BOARDS]
+        for x, y in [(0, 0), (5, 5), (9, 9)]:
+            for sea in seas:
+                sea.get_changes_by_bomb_attack(Point(x, y))
+
+        cells = [
+            [(cell.is_ship(), cell.is_selected) for cell in sea.coordinates.flat]
+            for sea in seas
+        ]
+        self.assertEqual(cells[0], cells[1])
+        self.assertEqual(
+            np.array([cell.is_selected for cell in seas[1].coordinates.flat]).sum(),
+            seas[1].board.get_selected_mask().sum(),
+        )
+
+
+class PlacementTest(unittest.TestCase):
+    def test_ships_do_not_touch(self):
+        layout = FleetPlacement(*CLASSIC, np.random.default_rng(0)).place()
+        sea = Sea(*CLASSIC, layout=layout)
+        for ship in sea.ships:
+            around = sea.board.get_ship_mask()[ship.area.x, ship.area.y]
+            self.assertEqual(around.sum(), ship.length)
+
+    def test_fleet_too_big_for_the_board(self):
+        with self.assertRaisesRegex(Exception, "Not Make Fleet"):
+            FleetPlacement(10, 10, CLASSIC[2] * 3).place()
+
+    def test_infeasible_fleet_ends(self):
+        # passes the area bound, the search has to prove it does not fit
+        fleet = [9] * 6
+        with self.assertRaisesRegex(Exception, "Not Make Fleet"):
+            FleetPlacement(10, 10, fleet, np.random.default_rng(0)).place()
+
+    def test_dense_fleet_is_always_placed(self):
+        fleet = [5, 4, 4, 3, 3, 3, 2, 2, 2, 1, 1, 1]
+        for seed in range(200):
+            layout = FleetPlacement(10, 10, fleet, np.random.default_rng(seed)).place()
+            Sea(10, 10, fleet, layout=layout)
+
+    def test_search_out_of_attempts_starts_again(self):
+        fleet = [5, 4, 4, 3, 3, 3, 2, 2, 2, 1, 1, 1]
+        placement = FleetPlacement(
+            10, 10, fleet, np.random.default_rng(0), max_attempts=1, max_restarts=3
+        )
+        self.assertEqual(len(placement.place()), len(fleet))
+
+    def test_fleet_deeper_than_the_recursion_limit(self):
+        fleet = CLASSIC[2] * 169
+        layout = FleetPlacement(130, 130, fleet, np.random.default_rng(0)).place()
+        self.assertEqual(len(layout), len(fleet))
+
+    def get_valid_placements(self, sea, length):
+        # every cell of the ship and around it is checked one by one
+        ships = {
+            (x, y)
+            for ship in sea.ships
+            for x in range(ship.points.x.start, ship.points.x.stop)
+            for y in range(ship.points.y.start, ship.points.y.stop)
+        }
+        valid = np.zeros((2, sea.row, sea.col), bool)
+        for direct, x, y in np.ndindex(valid.shape):
+            rows, cols = (length, 1) if direct == 0 else (1, length)
+            if x + rows > sea.row or y + cols > sea.col:
+                continue
+            # a 1 decker only goes down
+            if direct == 1 and length == 1:
+                continue
+            valid[direct, x, y] = not any(
+                (x + dx, y + dy) in ships
+                for dx in range(-1, rows + 1)
+                for dy in range(-1, cols + 1)
+            )
+        return valid
+
+    def assertValidPlacements(self, sea):
+        for length in range(1, 6):
+            self.assertTrue(
+                (
+                    sea.get_valid_placements(length)
+                    == self.get_valid_placements(sea, length)
+                ).all(),
+                f"{sea.engine} board, length {length}",
+            )
+
+    def test_valid_placements(self):
+        for engine in BOARDS:
+            for seed in range(30):
+                self.assertValidPlacements(Sea(*CLASSIC, engine=engine, seed=seed))
+
+    def test_valid_placements_at_the_border(self):
+        layout = [
+            (0, 0, 4, "right"),
+            (0, 6, 3, "right"),
+            (9, 7, 3, "right"),
+            (3, 9, 2, "down"),
+            (9, 0, 2, "right"),
+            (5, 0, 1, "down"),
+            (7, 9, 1, "down"),
+        ]
+        for engine in BOARDS:
+            self.assertValidPlacements(Sea(*CLASSIC, engine=engine, layout=layout))
+
+
+class PoolTest(unittest.TestCase):
+    def test_game_takes_the_spec_of_its_pool(self):
+        battle = SeaBattle("1", pool=FleetPool(14, 14, [5, 4, 3], seed=0))
+        self.assertIs(battle.spec, battle.pool.spec)
+        for x, y in np.ndindex(14, 14):
+            battle.select_cell(x, y)
+        self.assertTrue(battle.is_end_game())
+
+    def test_pool_of_another_spec(self):
+        with self.assertRaises(ValueError):
+            SeaBattle(
+                "1", pool=FleetPool(14, 14, [5, 4, 3]), spec=BoardSpec.get(*CLASSIC)
+            )
+
+    def test_layout_of_another_fleet(self):
+        layout = [(0, 0, 5, "down"), (0, 2, 4, "down"), (0, 4, 3, "down")]
+        with self.assertRaises(ValueError):
+            Table(layout)
+        with self.assertRaises(ValueError):
+            Sea(*CLASSIC, layout=layout)
+
+    def test_layout_outside_the_board(self):
+        spec = BoardSpec.get(14, 14, [5, 4, 3])
+        layout = [(12, 0, 5, "down"), (0, 2, 4, "down"), (0, 4, 3, "down")]
+        with self.assertRaises(ValueError):
+            Table(layout, spec=spec)
+        with self.assertRaises(ValueError):
+            Sea(14, 14, [5, 4, 3], layout=[(0, 0, 5, "left")] + layout[1:])
+
+
+class ComputerPlayerTest(unittest.TestCase):
+    # the 4 decker lies across the middle, away from the other ships
+    LAYOUT = [
+        (4, 3, 4, "right"),
+        (0, 0, 3, "down"),
+        (0, 9, 3, "down"),
+        (9, 0, 2, "right"),
+        (9, 8, 2, "right"),
+        (7, 5, 1, "down"),
+        (0, 5, 1, "down"),
+    ]
+
+    def make_player(self, seed=0):
+        sea = Sea(*CLASSIC, layout=self.LAYOUT)
+        return ComputerPlayer(sea, np.random.default_rng(seed))
+
+    def test_density_of_an_empty_board(self):
+        density = self.make_player().get_density()
+        # a 4 decker covers any of the middle 4 x 4 cells in as many ways
+        best = np.zeros(density.shape, dtype=bool)
+        best[3:7, 3:7] = True
+        self.assertTrue(((density == density.max()) == best).all())
+        self.assertEqual(density[0, 0], density.min())
+        self.assertTrue((density == density.T).all())
+
+    def test_no_density_on_selected_cells(self):
+        player = self.make_player()
+        player.fire_at(0, 4)
+        player.fire_at(4, 4)
+        density = player.get_density()
+        self.assertTrue((density[player.selected] == 0).all())
+        self.assertTrue((density[~player.selected] > 0).any())
+
+    def test_target_mode_fires_next_to_the_hit(self):
+        for seed in range(20):
+            player = self.make_player(seed)
+            player.fire_at(4, 4)
+            x, y = player.choose_cell()
+            self.assertEqual(abs(x - 4) + abs(y - 4), 1)
+
+            # only placements through the hit count
+            density = player.get_density()
+            density[4, :] = density[:, 4] = 0
+            self.assertFalse(density.any())
+
+    def test_sunk_ship_is_no_longer_hunted(self):
+        player = self.make_player()
+        for y in range(3, 7):
+            player.fire_at(4, y)
+        self.assertFalse(player.hits.any())
+        self.assertTrue(player.selected[3:6, 2:8].all())
+        self.assertEqual(player.sea.get_count_ships_by_length(4), 0)
+
+    def test_self_play_ends(self):
+        for engine in BOARDS:
+            for seed in range(20):
+                sea = Sea(*CLASSIC, engine=engine, seed=seed)
+                player = ComputerPlayer(sea, np.random.default_rng(seed))
+                shots = 0
+                while not sea.is_end_game():
+                    player.fire()
+                    shots += 1
+                    self.assertLessEqual(shots, sea.row * sea.col)
+
+
+class BatchTest(unittest.TestCase):
+    def shoot(self, sea, x, y):
+        # the result code and changed area SeaBatch gives for the shot
+        if sea.board.is_selected(x, y):
+            result = REPEAT
+        elif sea.board.get_ship(x, y) is None:
+            result = MISS
+        else:
+            result = HIT
+        points = sea.get_changes_by_bomb_attack(Point(x, y))
+        if result == HIT and not sea.board.get_ship(x, y).is_alive():
+            result = SUNK
+        return result, [points.x.start, points.x.stop, points.y.start, points.y.stop]
+
+    def test_batch_matches_every_game(self):
+        rng = np.random.default_rng(0)
+        for engine in BOARDS:
+            seas = [Sea(*CLASSIC, engine=engine, seed=seed) for seed in range(8)]
+            # a few shots before the batch is made
+            for sea in seas[::2]:
+                self.shoot(sea, 0, 0)
+            batch = SeaBatch.from_seas(seas)
+
+            # every cell once and some repeats, in a random order per game
+            size = CLASSIC[0] * CLASSIC[1]
+            shots = np.array(
+                [
+                    rng.permutation(
+                        np.concatenate([np.arange(size), rng.integers(size, size=50)])
+                    )
+                    for _ in seas
+                ]
+            )
+            for xs, ys in zip(*np.divmod(shots.T, CLASSIC[1])):
+                results, changes = batch.get_changes_by_bomb_attack(xs, ys)
+                for game, sea in enumerate(seas):
+                    result, change = self.shoot(sea, int(xs[game]), int(ys[game]))
+                    self.assertEqual(results[game], result)
+                    self.assertEqual(list(changes[game]), change)
+                    self.assertTrue(
+                        (batch.selected[game] == sea.board.get_selected_mask()).all()
+                    )
+
+                for length in set(CLASSIC[2]):
+                    self.assertEqual(
+                        list(batch.get_count_ships_by_length(length)),
+                        [sea.get_count_ships_by_length(length) for sea in seas],
+                    )
+                self.assertEqual(
+                    list(batch.is_end_game()), [sea.is_end_game() for sea in seas]
+                )
+            self.assertTrue(batch.is_end_game().all())
+
+
+class DeltaTest(unittest.TestCase):
+    # the 2 decker sits in the top left corner and a 1 decker in the
+    # bottom right one, their areas are clipped by the border
+    LAYOUT = [
+        (4, 3, 4, "right"),
+        (0, 5, 3, "down"),
+        (6, 0, 3, "down"),
+        (0, 0, 2, "right"),
+        (9, 4, 2, "right"),
+        (9, 9, 1, "down"),
+        (7, 7, 1, "down"),
+    ]
+
+    def setUp(self):
+        # the same game twice, one answers with dicts and one with deltas
+        self.battle = SeaBattle("1", table=Table(self.LAYOUT, seed=0))
+        self.wire = SeaBattle("1", table=Table(self.LAYOUT, seed=0))
+        self.view = self.wire.get_table_game().copy()
+
+    def shoot(self, x, y):
+        cells = self.battle.select_cell(x, y)
+        delta = self.wire.select_cell_delta(x, y)
+        self.assertEqual(decode_delta_cells(delta), cells)
+
+        apply_delta(self.view, delta)
+        self.assertTrue((self.view == self.wire.get_table_game()).all())
+        board = decode_board(self.wire.get_table_snapshot())
+        self.assertTrue((board == self.battle.get_table_game()).all())
+        return decode_delta(delta)[0]
+
+    def assertArea(self, points, x, y):
+        self.assertEqual((points.x, points.y), (slice(*x), slice(*y)))
+
+    def test_miss(self):
+        self.assertArea(self.shoot(5, 9), (5, 6), (9, 10))
+
+    def test_hit(self):
+        self.assertArea(self.shoot(4, 4), (4, 5), (4, 5))
+        self.assertEqual(self.view[4, 4], Cell.target.value)
+
+    def test_sunk_at_the_border(self):
+        self.shoot(0, 1)
+        self.assertArea(self.shoot(0, 0), (0, 2), (0, 3))
+        self.assertArea(self.shoot(9, 9), (8, 10), (8, 10))
+        self.assertEqual(self.view[8, 8], Cell.select.value)
+
+    def test_repeat(self):
+        self.shoot(5, 9)
+        self.assertArea(self.shoot(5, 9), (5, 6), (9, 10))
+        self.shoot(0, 1)
+        self.shoot(0, 0)
+        self.shoot(0, 0)
+
+    def test_whole_game(self):
+        for x, y in np.ndindex(10, 10):
+            self.shoot(x, y)
+        self.assertTrue(self.wire.is_end_game())
+
+
+class SnapshotTest(unittest.TestCase):
+    def play(self, game, shots):
+        for x, y in shots:
+            if isinstance(game, Sea):
+                game.get_changes_by_bomb_attack(Point(x, y))
+            else:
+                game.select_cell(x, y)
+
+    def shots(self, count):
+        rng = np.random.default_rng(2)
+        return [divmod(int(cell), 10) for cell in rng.integers(100, size=count)]
+
+    def assertSameSea(self, sea, other):
+        self.assertEqual(sea.engine, other.engine)
+        self.assertEqual(sea.seed, other.seed)
+        self.assertEqual(list(sea.moves), list(other.moves))
+        self.assertEqual(sea.fleet_status(), other.fleet_status())
+        self.assertTrue(
+            (sea.board.get_selected_mask() == other.board.get_selected_mask()).all()
+        )
+        self.assertEqual(
+            [ship.health for ship in sea.ships], [ship.health for ship in other.ships]
+        )
+
+    def assertSameBattle(self, battle, other):
+        self.assertEqual(battle.table.seed, other.table.seed)
+        self.assertEqual(list(battle.table.moves), list(other.table.moves))
+        self.assertEqual(battle.fleet_status(), other.fleet_status())
+        self.assertTrue((battle.get_table_game() == other.get_table_game()).all())
+
+    def test_sea_round_trip(self):
+        for engine in BOARDS:
+            sea = Sea(*CLASSIC, engine=engine, seed=3)
+            self.play(sea, self.shots(40))
+            restored = Sea.from_bytes(sea.to_bytes())
+            self.assertSameSea(sea, restored)
+
+            # both go on the same way
+            self.play(sea, self.shots(200))
+            self.play(restored, self.shots(200))
+            self.assertSameSea(sea, restored)
+
+    def test_table_round_trip(self):
+        battle = SeaBattle("1", seed=3)
+        self.play(battle, self.shots(40))
+        restored = SeaBattle.from_bytes("1", battle.to_bytes())
+        self.assertSameBattle(battle, restored)
+        self.assertEqual(restored.to_bytes(), battle.to_bytes())
+
+        self.play(battle, self.shots(200))
+        self.play(restored, self.shots(200))
+        self.assertSameBattle(battle, restored)
+
+    def test_cells_encode_the_same_way_in_numpy(self):
+        rng = np.random.default_rng(7)
+        for size in [1, 5, SMALL_CELLS, SMALL_CELLS + 1, 100, 101]:
+            cells = CELLS[rng.integers(len(CELLS), size=size)].reshape(1, size)
+            packed = encode_cells_array(cells)
+            self.assertEqual(packed, encode_cells(cells))
+            self.assertEqual(len(packed), -(-size // 4))
+            self.assertTrue((decode_cells(packed, cells.shape) == cells).all())
+
+    def test_snapshot_of_another_kind(self):
+        with self.assertRaises(ValueError):
+            Sea.from_bytes(SeaBattle("1", seed=3).to_bytes())
+        with self.assertRaises(ValueError):
+            Table.from_bytes(Sea(*CLASSIC, seed=3).to_bytes())
+
+    def test_snapshot_of_another_version(self):
+        # the version is the byte after the magic
+        for data in [Sea(*CLASSIC, seed=3).to_bytes(), Table(seed=3).to_bytes()]:
+            data = bytearray(data)
+            data[4] += 1
+            with self.assertRaises(ValueError):
+                Sea.from_bytes(bytes(data))
+            with self.assertRaises(ValueError):
+                Table.from_bytes(bytes(data))
+
+    def test_replay_matches_the_game(self):
+        for engine in BOARDS:
+            sea = Sea(*CLASSIC, engine=engine, seed=4)
+            self.play(sea, self.shots(60))
+            replayed = Sea.replay(*CLASSIC, sea.seed, sea.moves, engine=engine)
+            self.assertSameSea(sea, replayed)
+
+        battle = SeaBattle("1", seed=4)
+        self.play(battle, self.shots(60))
+        replayed = SeaBattle.replay("1", battle.table.seed, battle.table.moves)
+        self.assertSameBattle(battle, replayed)
+
+
+class SpecTest(unittest.TestCase):
+    def test_games_share_the_spec_after_pickle(self):
+        battle = SeaBattle("1", seed=5)
+        sea = Sea(*CLASSIC, seed=5)
+        data = pickle.dumps(battle)
+        self.assertIs(pickle.loads(data).spec, battle.spec)
+        self.assertIs(pickle.loads(data).table.spec, battle.spec)
+        self.assertIs(pickle.loads(pickle.dumps(sea)).spec, sea.spec)
+        self.assertIs(copy.deepcopy(sea).spec, sea.spec)
+        # the placements of the spec stay out of the pickle
+        self.assertLess(len(pickle.dumps(battle.spec)), 200)
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.registry = GameRegistry(
+            shards=1, max_games=10, ttl=600, clock=lambda: self.now
+        )
+
+    def test_use_of_a_shard_evicts_its_expired_games(self):
+        self.registry.create("a", "1", seed=6)
+        self.registry.create("b", "2", seed=6)
+        self.registry.select_cell("a", 0, 0)
+        self.now = 700
+        self.registry.get("b")
+        self.assertEqual(list(self.registry.shards[0].games), ["b"])
+        self.assertEqual(list(self.registry.store), ["a"])
+
+        battle = self.registry.get("a")
+        self.assertEqual(list(battle.table.moves), [0])
+        self.assertEqual(self.registry.metrics()["stored"], 0)
+
+    def test_evict_idle(self):
+        self.registry.create("a", "1", seed=6)
+        self.now = 700
+        self.registry.evict_idle()
+        self.assertEqual(self.registry.metrics()["games"], 0)
+        self.assertEqual(list(self.registry.store), ["a"])
+
+    def test_sweeper(self):
+        self.registry.create("a", "1", seed=6)
+        self.now = 700
+        stop = self.registry.start_sweeper(0.01)
+        try:
+            for _ in range(500):
+                if "a" in self.registry.store:
+                    break
+                time.sleep(0.01)
+        finally:
+            stop.set()
+        self.assertEqual(list(self.registry.store), ["a"])
+
+    def test_failed_restore_keeps_the_snapshot(self):
+        self.registry.create("a", "1", seed=6)
+        self.now = 700
+        self.registry.evict_idle()
+        user_id, data = self.registry.store["a"]
+        self.registry.store["a"] = (user_id, b"XXXX" + data[4:])
+        with self.assertRaises(ValueError):
+            self.registry.get("a")
+        self.assertIn("a", self.registry.store)
+
+        self.registry.store["a"] = (user_id, data)
+        self.assertEqual(self.registry.get("a").user_id, "1")
+
+
+class ServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = GameServer()
+        self.room = self.server.open_room("a", ["1", "2"], seeds=[8, 9])
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    def find_cell(self, user_id, value):
+        # a cell of the table user_id fires at
+        table = self.room.battles[self.room.get_opponent(user_id)].table
+        x, y = np.argwhere(table.coordinates == value)[0]
+        return int(x), int(y)
+
+    async def play(self, key):
+        # every player fires at the cells of the other table in order
+        room = self.server.get_room(key)
+        cells = {user_id: list(np.ndindex(10, 10)) for user_id in room.user_ids}
+        while room.winner is None:
+            user_id = room.turn
+            await self.server.move(key, user_id, *cells[user_id].pop())
+        return room.winner
+
+    async def test_turn_order(self):
+        with self.assertRaisesRegex(ValueError, "Not the turn of 2"):
+            await self.server.move("a", "2", 0, 0)
+
+        # a hit keeps the turn, a miss passes it
+        update = await self.server.move("a", "1", *self.find_cell("1", Cell.ship.value))
+        self.assertEqual(update["turn"], "1")
+        update = await self.server.move(
+            "a", "1", *self.find_cell("1", Cell.empty.value)
+        )
+        self.assertEqual(update["turn"], "2")
+        with self.assertRaisesRegex(ValueError, "Not the turn of 1"):
+            await self.server.move("a", "1", 0, 0)
+
+    async def test_delta_reaches_both_players(self):
+        queues = [self.server.subscribe("a", user_id) for user_id in ["1", "2"]]
+        table = self.room.battles["2"].table
+        view = table.coordinates.copy()
+
+        update = await self.server.move("a", "1", *self.find_cell("1", Cell.ship.value))
+        self.assertEqual(update["user_id"], "2")
+        for queue in queues:
+            self.assertEqual(await queue.get(), update)
+        apply_delta(view, update["delta"])
+        self.assertTrue((view == table.coordinates).all())
+
+    async def test_move_on_a_stopped_room(self):
+        first = self.room.send("1", 0, 0)
+        stopping = asyncio.create_task(self.room.stop())
+        await asyncio.sleep(0)
+        # put in the inbox after the stop, as moves were before send
+        late = Move("2", 0, 0, asyncio.get_running_loop().create_future())
+        self.room.inbox.put_nowait(late)
+        await stopping
+
+        self.assertEqual((await first)["user_id"], "2")
+        with self.assertRaisesRegex(RuntimeError, "is stopped"):
+            await asyncio.wait_for(late.future, 1)
+        with self.assertRaisesRegex(RuntimeError, "is stopped"):
+            await asyncio.wait_for(self.room.send("2", 0, 0), 1)
+
+    async def test_rooms_progress_independently(self):
+        # a room nobody moves in holds no other room back
+        self.server.open_room("idle", ["3", "4"])
+        for key in range(5):
+            self.server.open_room(key, [f"{key}-1", f"{key}-2"], seeds=[key, key + 10])
+        winners = await asyncio.gather(*[self.play(key) for key in range(5)])
+        for key, winner in enumerate(winners):
+            room = self.server.get_room(key)
+            self.assertIn(winner, room.user_ids)
+            self.assertTrue(room.battles[room.get_opponent(winner)].is_end_game())
+        self.assertEqual(self.server.get_room("idle").inbox.qsize(), 0)
+        self.assertIsNone(self.server.get_room("idle").winner)
@@ -0,0 +1,82 @@
+# drive simulated rooms against the game server from the projects directory:
+#     python -m sea.loadgen --rooms 1000
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from sea.server import GameServer
+
+
+async def listen(queue, counter):
+    # a client that only counts the updates it gets
+    while True:
+        update = await queue.get()
+        counter[0] += 1
+        if update["winner"] is not None:
+            return
+
+
+async def play_room(server, key, user_ids, rng, latencies, think):
+    room = server.get_room(key)
+    table = room.battles[user_ids[0]].table
+    # every player fires at the cells of the other table in random order
+    cells = {
+        user_id: list(rng.permutation(table.row * table.col)) for user_id in user_ids
+    }
+
+    while room.winner is None:
+        if think:
+            await asyncio.sleep(rng.exponential(think))
+        user_id = room.turn
+        x, y = divmod(int(cells[user_id].pop()), table.col)
+        start = time.perf_counter()
+        await server.move(key, user_id, x, y)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args):
+    server = GameServer()
+    rng = np.random.default_rng(args.seed)
+    latencies = []
+    counter = [0]
+
+    players = []
+    listeners = []
+    for key in range(args.rooms):
+        user_ids = [f"{key}-1", f"{key}-2"]
+        server.open_room(key, user_ids, seeds=rng.integers(1 << 63, size=2))
+        for user_id in user_ids:
+            listeners.append(listen(server.subscribe(key, user_id), counter))
+        players.append(
+            play_room(server, key, user_ids, rng, latencies, args.think / 1e3)
+        )
+
+    start = time.perf_counter()
+    await asyncio.gather(*players, *listeners)
+    spent = time.perf_counter() - start
+    await server.close()
+
+    latencies = np.array(latencies) * 1e3
+    print(
+        f"{args.rooms} rooms, {len(latencies)} moves, {counter[0]} updates: "
+        f"{len(latencies) / spent:8.0f} moves/s, "
+        f"p50 {np.percentile(latencies, 50):6.2f} ms, "
+        f"p99 {np.percentile(latencies, 99):6.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=1000)
+    # mean pause before each move in ms, without it every room fires as
+    # fast as it can and the latency is mostly waiting behind the others
+    parser.add_argument("--think", type=float, default=0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
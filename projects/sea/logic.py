@@ -1,8 +1,18 @@
-import random
+import struct
+from array import array
 from enum import Enum
+from functools import cached_property
 
 import numpy as np
 
+from game.placement import BoardSpec, FleetPlacement
+from game.snapshot import (
+    Snapshot,
+    get_move_typecode,
+    get_ship_id_dtype,
+    write_snapshot,
+)
+
 
 class Point:
     def __init__(self, x, y):
@@ -20,12 +30,161 @@ class Cell(Enum):
     target = "*"
 
 
+# binary form of a rectangle of the table: x, y, rows, cols followed by
+# the cells packed four per byte, each as its index in CELLS
+CELLS = np.array([cell.value for cell in Cell])
+CELL_CODES = {value: code for code, value in enumerate(CELLS)}
+# the code of every cell by the code point of its character
+CELL_CODE_TABLE = np.zeros(max(map(ord, CELLS)) + 1, dtype=np.uint8)
+CELL_CODE_TABLE[[ord(value) for value in CELLS]] = range(len(CELLS))
+CELL_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+# the four cells of every packed byte
+BYTE_CELLS = CELLS[np.arange(256, dtype=np.uint8)[:, None] >> CELL_SHIFTS & 3]
+DELTA_HEADER = struct.Struct("<4H")
+SNAPSHOT_MAGIC = b"SEAT"
+# up to this many cells plain python beats numpy
+SMALL_CELLS = 16
+
+
+def encode_cells(cells):
+    # deltas are mostly a single cell or a sunk ship with its area
+    if cells.size > SMALL_CELLS:
+        return encode_cells_array(cells)
+
+    packed = bytearray(-(-cells.size // 4))
+    for index, value in enumerate(cells.flat):
+        packed[index >> 2] |= CELL_CODES[value] << (index & 3) * 2
+    return bytes(packed)
+
+
+def encode_cells_array(cells):
+    # a one character string is one code point, so the cells are looked up
+    # as an uint32 array
+    points = np.ascontiguousarray(cells, dtype=CELLS.dtype).view(np.uint32)
+    codes = np.zeros(-(-cells.size // 4) * 4, dtype=np.uint8)
+    codes[: cells.size] = CELL_CODE_TABLE[points.ravel()]
+    codes = codes.reshape(-1, 4) << CELL_SHIFTS
+    return np.bitwise_or.reduce(codes, axis=1).tobytes()
+
+
+def decode_cells(data, shape):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    return BYTE_CELLS[packed].ravel()[: shape[0] * shape[1]].reshape(shape)
+
+
+def encode_delta(coordinates, points):
+    x_start, x_stop, _ = points.x.indices(coordinates.shape[0])
+    y_start, y_stop, _ = points.y.indices(coordinates.shape[1])
+    cells = coordinates[x_start:x_stop, y_start:y_stop]
+    return DELTA_HEADER.pack(x_start, y_start, *cells.shape) + encode_cells(cells)
+
+
+def decode_delta(data):
+    x, y, rows, cols = DELTA_HEADER.unpack_from(data)
+    cells = decode_cells(data[DELTA_HEADER.size :], (rows, cols))
+    return Point(slice(x, x + rows), slice(y, y + cols)), cells
+
+
+def decode_delta_cells(data):
+    # the same list select_cell returns, for clients that still want it
+    points, cells = decode_delta(data)
+    return [
+        {"x": points.x.start + x, "y": points.y.start + y, "result": cells[x, y]}
+        for x, y in np.ndindex(cells.shape)
+    ]
+
+
+def apply_delta(coordinates, data):
+    points, cells = decode_delta(data)
+    coordinates[points.x, points.y] = cells
+
+
+def encode_board(coordinates):
+    return encode_delta(coordinates, Point(slice(None), slice(None)))
+
+
+def decode_board(data):
+    _, cells = decode_delta(data)
+    return cells
+
+
+class Fleet:
+    # health of every ship in one array and the counters kept up to date
+    # on every damage, so the whole fleet is checked without walking the
+    # ships or the table
+    def __init__(self, lengths=(), health=None):
+        # health is that of a restored fleet, a new one is undamaged
+        if health is None:
+            health = lengths
+        self.lengths = np.array(lengths, dtype=np.int8)
+        self.health = np.array(health, dtype=np.int8)
+        self.remaining_cells = sum(health)
+        self.alive_ships = {}
+        for length, ship_health in zip(lengths, health):
+            self.alive_ships.setdefault(length, 0)
+            if ship_health > 0:
+                self.alive_ships[length] += 1
+        self.count_ships = 0
+
+    def add(self, length):
+        # ships given to __init__ only take their id, others grow the arrays
+        if self.count_ships == len(self.lengths):
+            self.lengths = np.append(self.lengths, np.int8(length))
+            self.health = np.append(self.health, np.int8(length))
+            self.remaining_cells += length
+            self.alive_ships[length] = self.alive_ships.get(length, 0) + 1
+
+        self.count_ships += 1
+        return self.count_ships - 1
+
+    def damage(self, ship_id):
+        if self.health[ship_id] > 0:
+            self.health[ship_id] -= 1
+            self.remaining_cells -= 1
+            if self.health[ship_id] == 0:
+                self.alive_ships[int(self.lengths[ship_id])] -= 1
+
+    def damage_many(self, hits):
+        # hits[ship_id] is the number of new hits; returns the sunk ship ids
+        hits = np.minimum(hits, self.health).astype(np.int8)
+        was_alive = self.health > 0
+        self.health -= hits
+        self.remaining_cells -= int(hits.sum())
+
+        sunk = np.flatnonzero(was_alive & (self.health == 0))
+        for ship_id in sunk:
+            self.alive_ships[int(self.lengths[ship_id])] -= 1
+        return sunk
+
+    def is_destroyed(self):
+        return self.remaining_cells == 0
+
+    def get_count_ships_by_length(self, length):
+        return self.alive_ships.get(length, 0)
+
+    def fleet_status(self):
+        return {
+            "remaining_cells": self.remaining_cells,
+            "alive_ships": dict(self.alive_ships),
+            "is_end_game": self.is_destroyed(),
+        }
+
+
 class Ship:
-    def __init__(self, point, length, direct):
+    def __init__(self, point, length, direct, fleet=None):
         self.points = self.get_points_by_direct(point, length, direct)
         self.area = self.get_area_points()
-        self.health = length
-        self.is_alive = True
+        self.length = length
+        self.fleet = fleet if fleet is not None else Fleet()
+        self.id = self.fleet.add(length)
+
+    @property
+    def health(self):
+        return int(self.fleet.health[self.id])
+
+    @property
+    def is_alive(self):
+        return bool(self.fleet.health[self.id] > 0)
 
     def get_points_by_direct(self, point, length, direct):
         if direct == "up":
@@ -45,9 +204,10 @@ class Ship:
             )
 
     def get_area_points(self):
+        x, y = self.points.x, self.points.y
         return Point(
-            slice(max(0, self.points.x.start - 1), max(0, self.points.x.stop + 1)),
-            slice(max(0, self.points.y.start - 1), max(0, self.points.y.stop + 1)),
+            slice(max(0, x.start - 1), x.stop + 1),
+            slice(max(0, y.start - 1), y.stop + 1),
         )
 
     def check_inside_of_points(self, x, y):
@@ -58,49 +218,100 @@ class Ship:
         return False
 
     def damage(self):
-        if self.is_alive:
-            self.health -= 1
-        if self.health == 0:
-            self.is_alive = False
+        self.fleet.damage(self.id)
 
 
 class Table:
+    # the classic game, other sizes and fleets come with a spec
     row = 10
     col = 10
 
-    def __init__(self):
+    list_lenght_ships = [4, 3, 3, 2, 2, 1, 1]
+
+    def __init__(self, layout=None, seed=None, spec=None):
+        if spec is None:
+            spec = BoardSpec.get(self.row, self.col, self.list_lenght_ships)
+        self.spec = spec
+        self.row = spec.row
+        self.col = spec.col
+        self.list_lenght_ships = spec.list_lenght_ships
+
         self.coordinates = np.full((self.row, self.col), Cell.empty.value)
-        self.make_ships()
+        # ship id of every cell, -1 where there is no ship
+        dtype = get_ship_id_dtype(len(self.list_lenght_ships))
+        self.ship_ids = np.full((self.row, self.col), -1, dtype=dtype)
+        # every game draws from its own generator, so its seed and the
+        # move log are enough to rebuild it
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.moves = array(get_move_typecode(self.row, self.col))
+        self.make_ships(layout)
+
+    @cached_property
+    def rng(self):
+        # only drawn from to place the fleet, a restored table never makes one
+        return np.random.default_rng(self.seed)
+
+    @classmethod
+    def from_bytes(cls, data):
+        # the state is set straight from the blocks of the snapshot, without
+        # __init__: the layout was checked when the table was made
+        snapshot = Snapshot(data, SNAPSHOT_MAGIC)
+        layout = snapshot.get_layout()
+        table = cls.__new__(cls)
+        table.spec = BoardSpec.get(
+            snapshot.row, snapshot.col, [length for _, _, length, _ in layout]
+        )
+        table.row = snapshot.row
+        table.col = snapshot.col
+        table.list_lenght_ships = table.spec.list_lenght_ships
+        table.seed = snapshot.seed
+        table.moves = array(get_move_typecode(table.row, table.col))
+        table.moves.frombytes(snapshot.moves.tobytes())
+        table.coordinates = decode_cells(snapshot.cells, (table.row, table.col))
+
+        table.ship_ids = snapshot.ship_ids.copy()
+        table.fleet = Fleet(table.list_lenght_ships, snapshot.get_health().tolist())
+        table.ships = [
+            Ship(Point(x, y), length, direct, table.fleet)
+            for x, y, length, direct in layout
+        ]
+        return table
+
+    def to_bytes(self):
+        return write_snapshot(
+            SNAPSHOT_MAGIC,
+            0,
+            self.row,
+            self.col,
+            self.seed,
+            self.ships,
+            self.moves,
+            self.ship_ids,
+            encode_cells(self.coordinates),
+        )
 
-    def make_ships(self):
-        list_lenght_ships = [4, 3, 3, 2, 2, 1, 1]
+    def make_ships(self, layout=None):
+        if layout is None:
+            placement = FleetPlacement(
+                self.row, self.col, self.list_lenght_ships, self.rng, spec=self.spec
+            )
+            layout = placement.place()
+        else:
+            self.spec.check_layout(layout)
+
+        self.fleet = Fleet([length for _, _, length, _ in layout])
         self.ships = []
-        for length in list_lenght_ships:
-            self.ships.append(self.make_ship(length))
-
-    def make_ship(self, length):
-        while True:
-            point = self.get_random_empty_point()
-            directs = np.array(["up", "down", "right", "left"])
-            random.shuffle(directs)
-            for direct in directs:
-                ship = self.get_random_ship(point, length, direct)
-                if ship is not None:
-                    self.coordinates[ship.points.x, ship.points.y] = Cell.ship.value
-                    return ship
-
-    def get_random_empty_point(self):
-        while True:
-            x = random.randrange(self.row)
-            y = random.randrange(self.col)
-            if self.coordinates[x, y] == Cell.empty.value:
-                return Point(x, y)
+        for x, y, length, direct in layout:
+            ship = Ship(Point(x, y), length, direct, self.fleet)
+            self.coordinates[ship.points.x, ship.points.y] = Cell.ship.value
+            self.ship_ids[ship.points.x, ship.points.y] = ship.id
+            self.ships.append(ship)
 
     def check_points_valid(self, points):
         if points.x.start < 0 or points.y.start < 0:
             return False
 
-        if points.x.stop > self.row - 1 or points.y.stop > self.col - 1:
+        if points.x.stop > self.row or points.y.stop > self.col:
             return False
 
         return True
@@ -110,25 +321,50 @@ class Table:
             return False
         return True
 
-    def get_random_ship(self, point, length, direct):
-        ship = Ship(point, length, direct)
-
-        if self.check_points_valid(ship.points) and self.check_area_ship_valid(
-            ship.area
-        ):
-            return ship
-        return None
+    def get_valid_placements(self, length):
+        return self.spec.get_valid_placements(self.ship_ids >= 0, length)
 
     def select_ship(self, point):
-        for ship in self.ships:
-            if ship.check_inside_of_points(point.x, point.y):
-                ship.damage()
-                if not ship.is_alive:
-                    self.coordinates[ship.area.x, ship.area.y] = Cell.select.value
-                    self.coordinates[ship.points.x, ship.points.y] = Cell.target.value
-                    return ship.area
+        ship = self.ships[self.ship_ids[point.x, point.y]]
+        ship.damage()
+        if not ship.is_alive:
+            self.coordinates[ship.area.x, ship.area.y] = Cell.select.value
+            self.coordinates[ship.points.x, ship.points.y] = Cell.target.value
+            return ship.area
+
+        self.coordinates[point.x, point.y] = Cell.target.value
+        return Point(slice(point.x, point.x + 1), slice(point.y, point.y + 1))
+
+    def apply_moves(self, moves):
+        # the state after a set of shots does not depend on their order, so
+        # it is worked out with array operations instead of shot by shot
+        self.moves.extend(moves)
+        shots = np.zeros(self.row * self.col, dtype=bool)
+        shots[np.asarray(moves, dtype=np.int64)] = True
+        shots = shots.reshape(self.row, self.col)
+        shots &= np.isin(self.coordinates, [Cell.empty.value, Cell.ship.value])
+
+        hits = shots & (self.ship_ids >= 0)
+        self.coordinates[shots & ~hits] = Cell.select.value
+        self.coordinates[hits] = Cell.target.value
+
+        damage = np.bincount(self.ship_ids[hits], minlength=len(self.ships))
+        for ship_id in self.fleet.damage_many(damage):
+            ship = self.ships[ship_id]
+            self.coordinates[ship.area.x, ship.area.y] = Cell.select.value
+            self.coordinates[ship.points.x, ship.points.y] = Cell.target.value
+
+    def is_end_game(self):
+        return self.fleet.is_destroyed()
+
+    def get_count_ships_by_length(self, length):
+        return self.fleet.get_count_ships_by_length(length)
+
+    def fleet_status(self):
+        return self.fleet.fleet_status()
 
     def select_cell(self, point):
+        self.moves.append(point.x * self.col + point.y)
         selecte_cell = self.coordinates[point.x, point.y]
 
         if selecte_cell == Cell.ship.value:
@@ -139,14 +375,46 @@ class Table:
             self.coordinates[point.x, point.y] = Cell.select.value
             return Point(slice(point.x, point.x + 1), slice(point.y, point.y + 1))
 
+        # selected before, nothing changes
+        return Point(slice(point.x, point.x + 1), slice(point.y, point.y + 1))
+
 
 # Manage Game
 class SeaBattle:
-    def __init__(self, user_id):
-        self.start_new_game()
-
-    def start_new_game(self):
-        self.table = Table()
+    def __init__(self, user_id, pool=None, seed=None, table=None, spec=None):
+        self.user_id = user_id
+        self.pool = pool
+        if pool is not None:
+            if spec is None:
+                spec = pool.spec
+            elif spec is not pool.spec:
+                raise ValueError("The pool makes layouts of another spec")
+        if table is None:
+            self.spec = spec
+            self.start_new_game(seed)
+        else:
+            self.spec = table.spec
+            self.table = table
+
+    @classmethod
+    def replay(cls, user_id, seed, moves, spec=None):
+        battle = cls(user_id, seed=seed, spec=spec)
+        battle.table.apply_moves(moves)
+        return battle
+
+    @classmethod
+    def from_bytes(cls, user_id, data):
+        return cls(user_id, table=Table.from_bytes(data))
+
+    def to_bytes(self):
+        return self.table.to_bytes()
+
+    def start_new_game(self, seed=None):
+        # a layout from the pool was not drawn from the seed, such a game
+        # can not be replayed from it
+        layout = self.pool.pop() if self.pool is not None else None
+        self.table = Table(layout, seed, self.spec)
+        self.spec = self.table.spec
 
     def get_table_game(self):
         return self.table.coordinates
@@ -155,8 +423,9 @@ class SeaBattle:
         points = self.table.select_cell(Point(x, y))
 
         data = []
-        for x in range(points.x.start, points.x.stop):
-            for y in range(points.y.start, points.y.stop):
+        # an area next to the border reaches past the table
+        for x in range(*points.x.indices(self.table.row)):
+            for y in range(*points.y.indices(self.table.col)):
                 data.append(
                     {
                         "x": x,
@@ -166,11 +435,20 @@ class SeaBattle:
                 )
         return data
 
+    def select_cell_delta(self, x, y):
+        points = self.table.select_cell(Point(x, y))
+        return encode_delta(self.table.coordinates, points)
+
+    def get_table_snapshot(self):
+        return encode_board(self.table.coordinates)
+
     def is_end_game(self):
-        if Cell.ship.value not in self.table.coordinates:
-            return True
-        return False
+        return self.table.is_end_game()
+
+    def fleet_status(self):
+        return self.table.fleet_status()
 
 
-sea = SeaBattle("1")
-print(sea.get_table_game())
+if __name__ == "__main__":
+    sea = SeaBattle("1")
+    print(sea.get_table_game())
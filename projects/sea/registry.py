@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sea.logic import SeaBattle
+
+
+class GameShard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [battle, last used], oldest first
+        self.games = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+class GameRegistry:
+    # live games are split over shards, each with its own lock and LRU; a
+    # game that falls out of its LRU or stays idle longer than ttl seconds
+    # is parked in store as a snapshot and rebuilt on its next use; every
+    # use of a shard evicts its expired games, the games of shards nobody
+    # uses only expire in evict_idle, which start_sweeper runs on a timer
+    def __init__(
+        self, shards=16, max_games=10000, ttl=600, store=None, clock=time.monotonic
+    ):
+        self.shards = [GameShard() for _ in range(shards)]
+        self.max_games_per_shard = max(1, max_games // shards)
+        self.ttl = ttl
+        # key -> (user id, snapshot), any mapping works
+        self.store = store if store is not None else {}
+        self.clock = clock
+
+    def get_shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    def create(self, key, user_id, **kwargs):
+        shard = self.get_shard(key)
+        battle = SeaBattle(user_id, **kwargs)
+        with shard.lock:
+            self.store.pop(key, None)
+            self.put(shard, key, battle)
+        return battle
+
+    def put(self, shard, key, battle):
+        now = self.clock()
+        shard.games[key] = [battle, now]
+        shard.games.move_to_end(key)
+
+        while len(shard.games) > self.max_games_per_shard:
+            self.evict(shard, *shard.games.popitem(last=False))
+        self.evict_expired(shard, now)
+
+    def evict_expired(self, shard, now):
+        while shard.games:
+            _, last_used = next(iter(shard.games.values()))
+            if now - last_used <= self.ttl:
+                break
+            self.evict(shard, *shard.games.popitem(last=False))
+
+    def evict(self, shard, key, entry):
+        battle, _ = entry
+        self.store[key] = (battle.user_id, battle.to_bytes())
+        shard.evictions += 1
+
+    def load(self, shard, key):
+        entry = shard.games.get(key)
+        if entry is not None:
+            shard.hits += 1
+            entry[1] = now = self.clock()
+            shard.games.move_to_end(key)
+            self.evict_expired(shard, now)
+            return entry[0]
+
+        shard.misses += 1
+        if key not in self.store:
+            raise KeyError(key)
+
+        # the snapshot stays stored until the game is rebuilt from it, a
+        # failed restore must not lose the game
+        user_id, data = self.store[key]
+        battle = SeaBattle.from_bytes(user_id, data)
+        self.store.pop(key, None)
+        self.put(shard, key, battle)
+        return battle
+
+    def get(self, key):
+        shard = self.get_shard(key)
+        with shard.lock:
+            return self.load(shard, key)
+
+    def select_cell(self, key, x, y):
+        # moves of one game never run at the same time
+        shard = self.get_shard(key)
+        with shard.lock:
+            return self.load(shard, key).select_cell(x, y)
+
+    def select_cell_delta(self, key, x, y):
+        shard = self.get_shard(key)
+        with shard.lock:
+            return self.load(shard, key).select_cell_delta(x, y)
+
+    def remove(self, key):
+        shard = self.get_shard(key)
+        with shard.lock:
+            shard.games.pop(key, None)
+            self.store.pop(key, None)
+
+    def evict_idle(self):
+        now = self.clock()
+        for shard in self.shards:
+            with shard.lock:
+                self.evict_expired(shard, now)
+
+    def start_sweeper(self, interval=None):
+        # runs evict_idle every interval seconds, ttl by default, in a
+        # daemon thread; set the returned event to stop it
+        if interval is None:
+            interval = self.ttl
+        stop = threading.Event()
+
+        def sweep():
+            while not stop.wait(interval):
+                self.evict_idle()
+
+        threading.Thread(
+            target=sweep, name="game-registry-sweeper", daemon=True
+        ).start()
+        return stop
+
+    def metrics(self):
+        return {
+            "games": sum(len(shard.games) for shard in self.shards),
+            "stored": len(self.store),
+            "hits": sum(shard.hits for shard in self.shards),
+            "misses": sum(shard.misses for shard in self.shards),
+            "evictions": sum(shard.evictions for shard in self.shards),
+        }
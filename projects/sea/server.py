@@ -0,0 +1,169 @@
+import asyncio
+
+from sea.logic import Cell, SeaBattle
+
+
+class Move:
+    def __init__(self, user_id, x, y, future):
+        self.user_id = user_id
+        self.x = x
+        self.y = y
+        self.future = future
+
+
+class RoomActor:
+    # a room owns its games and is only changed by its own task, which
+    # takes the moves one by one from the inbox; rooms never wait on
+    # each other, so there is no lock at all
+    def __init__(self, key, user_ids, spec=None, seeds=None):
+        self.key = key
+        self.user_ids = list(user_ids)
+        seeds = seeds if seeds is not None else [None] * len(self.user_ids)
+        # every player has their own table, the other one fires at it
+        self.battles = {
+            user_id: SeaBattle(user_id, seed=seed, spec=spec)
+            for user_id, seed in zip(self.user_ids, seeds)
+        }
+        self.turn = self.user_ids[0]
+        self.winner = None
+        self.inbox = asyncio.Queue()
+        self.listeners = {user_id: [] for user_id in self.user_ids}
+        self.task = None
+        self.is_stopped = False
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def send(self, user_id, x, y):
+        # returns the future of the move, a stopped room takes no more moves
+        future = asyncio.get_running_loop().create_future()
+        if self.is_stopped:
+            future.set_exception(self.get_stopped_error())
+        else:
+            self.inbox.put_nowait(Move(user_id, x, y, future))
+        return future
+
+    def get_stopped_error(self):
+        return RuntimeError(f"Room {self.key} is stopped")
+
+    async def run(self):
+        try:
+            await self.take_moves()
+        finally:
+            self.reject_moves()
+
+    def reject_moves(self):
+        # the moves still in the inbox are never applied, their senders
+        # must not wait for them
+        while not self.inbox.empty():
+            move = self.inbox.get_nowait()
+            if move is not None and not move.future.done():
+                move.future.set_exception(self.get_stopped_error())
+
+    async def take_moves(self):
+        while True:
+            move = await self.inbox.get()
+            if move is None:
+                break
+            try:
+                update = self.apply(move.user_id, move.x, move.y)
+            except Exception as error:
+                # the traceback holds the frame of this task, a sender that
+                # clears the frames of the error would close the task
+                if not move.future.done():
+                    move.future.set_exception(error.with_traceback(None))
+                continue
+            # the sender may have given up waiting, the move still counts
+            if not move.future.done():
+                move.future.set_result(update)
+            self.broadcast(update)
+
+    def get_opponent(self, user_id):
+        return next(other for other in self.user_ids if other != user_id)
+
+    def apply(self, user_id, x, y):
+        if self.winner is not None:
+            raise ValueError("Game is over")
+        if user_id != self.turn:
+            raise ValueError(f"Not the turn of {user_id}")
+
+        opponent = self.get_opponent(user_id)
+        battle = self.battles[opponent]
+        if not (0 <= x < battle.table.row and 0 <= y < battle.table.col):
+            raise ValueError(f"Cell ({x}, {y}) is out of the table")
+        # a hit keeps the turn, anything else passes it
+        is_hit = battle.table.coordinates[x, y] == Cell.ship.value
+        delta = battle.select_cell_delta(x, y)
+
+        if battle.is_end_game():
+            self.winner = user_id
+        elif not is_hit:
+            self.turn = opponent
+
+        return {
+            "user_id": opponent,
+            "delta": delta,
+            "turn": self.turn,
+            "winner": self.winner,
+        }
+
+    def broadcast(self, update):
+        # both players get the same delta, the owner of the table to show
+        # the shot on their board and the other one on their view of it
+        for queues in self.listeners.values():
+            for queue in queues:
+                queue.put_nowait(update)
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue()
+        self.listeners[user_id].append(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        self.listeners[user_id].remove(queue)
+
+    async def stop(self):
+        # the moves sent before are still applied
+        if not self.is_stopped:
+            self.is_stopped = True
+            self.inbox.put_nowait(None)
+        if self.task is not None:
+            await self.task
+        else:
+            self.reject_moves()
+
+
+class GameServer:
+    # rooms are keyed like RoomGameModel, by room id with user1 and user2
+    # as players; the server only starts, finds and stops their actors
+    def __init__(self, spec=None):
+        self.spec = spec
+        self.rooms = {}
+
+    def open_room(self, key, user_ids, seeds=None):
+        if key in self.rooms:
+            raise ValueError(f"Room {key} is already open")
+
+        room = RoomActor(key, user_ids, self.spec, seeds)
+        self.rooms[key] = room
+        room.start()
+        return room
+
+    def get_room(self, key):
+        if key not in self.rooms:
+            raise KeyError(key)
+        return self.rooms[key]
+
+    async def move(self, key, user_id, x, y):
+        return await self.get_room(key).send(user_id, x, y)
+
+    def subscribe(self, key, user_id):
+        return self.get_room(key).subscribe(user_id)
+
+    async def close_room(self, key):
+        room = self.rooms.pop(key, None)
+        if room is not None:
+            await room.stop()
+
+    async def close(self):
+        await asyncio.gather(*[self.close_room(key) for key in list(self.rooms)])